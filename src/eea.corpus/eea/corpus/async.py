@@ -37,10 +37,16 @@ queue = make_queue()
 def worker(config_uri):
     """ Console entry script that starts a worker process
     """
-    # TODO: import spacy's model to share it between workers
-
     pyramid_env = bootstrap(config_uri)
 
+    # load the spaCy model before the jobs are forked, to share it with them.
+    # A missing or broken model only fails the noun chunks processing
+    try:
+        from eea.corpus.processing.noun_chunks import get_nlp
+        get_nlp()
+    except Exception:
+        logger.exception("Could not preload the spaCy model")
+
     # this conflicts with normal worker output
     # TODO: solve logging for the console
     # Setup logging to allow log output from command methods
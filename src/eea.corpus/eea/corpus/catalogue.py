@@ -0,0 +1,156 @@
+""" A catalogue of the created corpuses.
+
+The catalogue is a SQLite database, saved in the corpus storage. It is updated
+when a corpus is built or deleted and it allows listing the corpuses without
+loading them or walking the storage folders.
+
+The catalogue is filled with the corpuses already in the storage (see
+``eea.corpus.corpus.rebuild_catalogue``) only once, which is recorded with
+``mark_populated``. Until then, the corpuses registered by builds are not the
+full list of corpuses.
+"""
+
+import logging
+import os.path
+import sqlite3
+from collections import namedtuple
+
+from eea.corpus.config import CORPUS_STORAGE
+
+logger = logging.getLogger('eea.corpus')
+
+# The lightweight corpus information that is shown in listings
+CorpusInfo = namedtuple('CorpusInfo',
+                        ['file_name', 'corpus_id', 'title', 'description',
+                         'n_docs'])
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS corpus (
+    file_name TEXT NOT NULL,
+    corpus_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    n_docs INTEGER NOT NULL,
+    PRIMARY KEY (file_name, corpus_id)
+)
+"""
+
+CREATE_META_TABLE = """
+CREATE TABLE IF NOT EXISTS catalogue_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+)
+"""
+
+
+def catalogue_path():
+    """ Returns the path of the catalogue database
+    """
+
+    return os.path.join(CORPUS_STORAGE, 'var', 'catalogue.db')
+
+
+def catalogue_exists():
+    return os.path.exists(catalogue_path())
+
+
+def connect():
+    """ Returns a connection to the catalogue, creating it if needed
+    """
+
+    path = catalogue_path()
+    base = os.path.dirname(path)
+
+    if not os.path.exists(base):
+        os.makedirs(base)
+
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute(CREATE_TABLE)
+    conn.execute(CREATE_META_TABLE)
+
+    return conn
+
+
+def is_populated():
+    """ Check if the catalogue has been filled with the stored corpuses
+    """
+
+    if not catalogue_exists():
+        return False
+
+    conn = connect()
+    try:
+        row = conn.execute(
+            "SELECT value FROM catalogue_meta WHERE key = 'populated'"
+        ).fetchone()
+    finally:
+        conn.close()
+
+    return row is not None
+
+
+def mark_populated():
+    """ Records that the catalogue has been filled with the stored corpuses
+    """
+
+    conn = connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO catalogue_meta VALUES "
+                "('populated', '1')"
+            )
+    finally:
+        conn.close()
+
+
+def register_corpus(file_name, corpus_id, title, description, n_docs):
+    """ Adds (or updates) a corpus in the catalogue
+    """
+
+    conn = connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO corpus VALUES (?, ?, ?, ?, ?)",
+                (file_name, corpus_id, title, description or '', n_docs)
+            )
+    finally:
+        conn.close()
+
+
+def unregister_corpus(file_name, corpus_id):
+    """ Removes a corpus from the catalogue
+    """
+
+    conn = connect()
+    try:
+        with conn:
+            conn.execute(
+                "DELETE FROM corpus WHERE file_name = ? AND corpus_id = ?",
+                (file_name, corpus_id)
+            )
+    finally:
+        conn.close()
+
+
+def catalogue_corpuses():
+    """ Returns a mapping of file_name: [CorpusInfo, ...]
+    """
+
+    res = {}
+
+    conn = connect()
+    try:
+        rows = conn.execute(
+            "SELECT file_name, corpus_id, title, description, n_docs "
+            "FROM corpus ORDER BY file_name, title"
+        ).fetchall()
+    finally:
+        conn.close()
+
+    for row in rows:
+        info = CorpusInfo(*row)
+        res.setdefault(info.file_name, []).append(info)
+
+    return res
@@ -2,6 +2,32 @@ import os
 
 CORPUS_STORAGE = "/corpus"
 
+# Default number of worker processes used to run the pipeline when building a
+# corpus. Each RQ worker starts its own pool, so set it in the ini file, with
+# ``corpus.pipeline_processes``, according to the number of RQ workers
+PIPELINE_PROCESSES = 1
+
+# Save the output of the pipeline steps, to resume the pipelines from it (see
+# eea.corpus.processing.build_pipeline). Each build can save about one copy
+# of the corpus for each pipeline step, so it's disabled by default.
+PIPELINE_STEP_CACHE = False
+
+# The saved steps outputs are removed when they are older than
+# STEP_CACHE_MAX_AGE seconds, or, oldest first, when all of them are bigger
+# than STEP_CACHE_MAX_SIZE bytes
+STEP_CACHE_MAX_AGE = 7 * 24 * 3600
+STEP_CACHE_MAX_SIZE = 10 * 1024 ** 3
+
+
+def pipeline_processes(settings):
+    """ Returns the number of worker processes used to build a corpus
+    """
+
+    value = (settings or {}).get('corpus.pipeline_processes',
+                                 PIPELINE_PROCESSES)
+
+    return max(1, int(value))
+
 
 def upload_location(file_name):
     """ Returns the path where an upload file would be saved, in the storage
@@ -1,14 +1,22 @@
 import json
 import logging
 import os.path
+import sys
+import time
 from collections import defaultdict
+from itertools import islice
 
 from eea.corpus.async import queue
-from eea.corpus.config import CORPUS_STORAGE
+from eea.corpus.catalogue import (catalogue_corpuses, is_populated,
+                                  mark_populated, register_corpus,
+                                  unregister_corpus)
+from eea.corpus.config import (CORPUS_STORAGE, PIPELINE_STEP_CACHE,
+                               pipeline_processes)
 from eea.corpus.processing import build_pipeline
-from eea.corpus.utils import is_valid_document
+from eea.corpus.storage import docs_index_path, iter_docs, read_doc, write_docs
+from eea.corpus.utils import LRUCache, is_valid_document
+from pyramid.threadlocal import get_current_registry
 from rq.decorators import job
-from textacy import io
 
 logger = logging.getLogger('eea.corpus')
 
@@ -30,6 +38,9 @@ def delete_corpus(file_name, corpus_id):
     assert len(corpus_id) > 10
     cp = corpus_base_path(file_name)
 
+    invalidate_corpus(file_name, corpus_id)
+    unregister_corpus(file_name, corpus_id)
+
     for f in os.listdir(cp):
         if f.startswith(corpus_id):
             fp = os.path.join(cp, f)
@@ -53,20 +64,27 @@ def available_corpus(file_name):
     for fn in os.listdir(base):
         if '_' not in fn:
             continue
-        base, spec = fn.split('_', 1)
-        files[base].append(spec)
+        corpus, spec = fn.split('_', 1)
+        files[corpus].append(spec)
 
-        for corpus, cfs in files.items():
-            if len(cfs) != len(('docs', 'info')):
-                logger.warning("Not a valid corpus: %s (%s)",
-                               file_name, corpus)
+    for corpus, cfs in files.items():
+        if not is_complete_corpus(cfs):
+            logger.warning("Not a valid corpus: %s (%s)", file_name, corpus)
 
-                continue
-            res.append(corpus)
+            continue
+        res.append(corpus)
 
     return res
 
 
+def is_complete_corpus(specs):
+    """ Check if the files of a corpus (their <corpusid>_ suffixes) are all
+    the needed files. The docs index is optional.
+    """
+
+    return {'docs.json', 'info.json'}.issubset(specs)
+
+
 def corpus_info_path(file_name, corpus_id):
     """ Returns the <corpusid>_info.json file path for a given doc/corpus
     """
@@ -77,6 +95,14 @@ def corpus_info_path(file_name, corpus_id):
     return meta_path
 
 
+def corpus_docs_path(file_name, corpus_id):
+    """ Returns the <corpusid>_docs.json file path for a given doc/corpus
+    """
+    cpath = corpus_base_path(file_name)
+
+    return os.path.join(cpath, '%s_docs.json' % corpus_id)
+
+
 def load_corpus_metadata(file_name, corpus_id):
     """ Returns the EEA specific metadata saved for a doc/corpus
     """
@@ -120,8 +146,11 @@ def save_corpus_metadata(stats, file_name, corpus_id, text_column, **kw):
         'text_column': text_column,
         'kw': kw,
     }
+    # serialize before writing, so that errors don't leave a partial file
+    data = json.dumps(info)
+
     with open(meta_path, 'w') as f:
-        json.dump(info, f)
+        f.write(data)
 
 
 class DocStream:
@@ -155,59 +184,149 @@ def build_corpus(pipeline, corpus_id, file_name, text_column, **kw):
     """ Async job to build a corpus using the provided pipeline
     """
 
-    cpath = corpus_base_path(file_name)      # corpus_id
-    fname = os.path.join(cpath, '%s_docs.json' % corpus_id)
-    logger.info('Creating corpus for %s at %s', file_name, cpath)
+    fname = corpus_docs_path(file_name, corpus_id)
+    logger.info('Creating corpus for %s at %s', file_name, fname)
 
-    docs = build_pipeline(file_name, text_column, pipeline, preview_mode=False)
+    processes = pipeline_processes(get_current_registry().settings)
+    start = time.time()
+
+    docs = build_pipeline(file_name, text_column, pipeline, preview_mode=False,
+                          use_cache=PIPELINE_STEP_CACHE, processes=processes)
 
     stream = DocStream(docs)
+    write_docs(stream, fname, codec=kw.get('codec', 'none'),
+               doc_format=kw.get('doc_format', 'json'))
 
-    io.json.write_json(
-        stream, fname, mode='wt', lines=True, ensure_ascii=True,
-        separators=(',', ':')
-    )
+    elapsed = time.time() - start
+    logger.info('Created corpus for %s: %s docs, %.1f docs/sec',
+                file_name, stream.n_docs, stream.n_docs / (elapsed or 1))
     save_corpus_metadata(
         stream.get_statistics(), file_name, corpus_id, text_column, **kw
     )
+    register_corpus(file_name, corpus_id, kw['title'],
+                    kw.get('description', ''), stream.n_docs)
+
+
+def _doc_size(doc):
+    # the text is by far the biggest part of a document
+    return sys.getsizeof(doc['text'])
+
+
+# Cache policies for the documents read by position from a Corpus
+DOC_CACHE_POLICIES = {
+    'none': None,
+    'count': None,          # LRU, bounded by number of documents
+    'bytes': _doc_size,     # LRU, bounded by (approximate) size in bytes
+    'shared': None,         # the shared_docs_cache
+}
+
+# Documents read by position, shared by all the corpuses using the 'shared'
+# cache policy (such as the corpuses of the registry), so that the memory
+# they use is bounded no matter how many corpuses are loaded. The keys are
+# (file_name, corpus_id, position)
+SHARED_DOCS_CACHE_SIZE = 256 * 1024 ** 2
+shared_docs_cache = LRUCache(SHARED_DOCS_CACHE_SIZE, getsizeof=_doc_size)
 
 
 class Corpus(object):
     """ Corpus objects are just a lightweight wrapper over a stream.
 
-    They pass and cache items in the stream. Once the stream is consumed, the
-    corpus restarts its stream and streams docs from cached memory
+    Each iteration over a corpus reopens and streams its docs file, so it can
+    be iterated many times without holding the documents in memory.
+
+    The documents read by position (see ``get_doc``) are kept in a bounded
+    LRU cache. Slices are streamed from the docs file, without the cache. The
+    ``cache_policy`` can be one of:
+
+        * ``none``: don't cache documents
+        * ``count``: keep at most ``cache_size`` documents
+        * ``bytes``: keep at most ``cache_size`` bytes of documents
+        * ``shared``: use the ``shared_docs_cache``, ``cache_size`` is
+          ignored
     """
 
-    def __init__(self, file_name, corpus_id):
+    def __init__(self, file_name, corpus_id, cache_policy='count',
+                 cache_size=100):
         self.file_name = file_name
         self.corpus_id = corpus_id
 
-        self._cache = []
-        self._use_cache = False
+        if cache_policy not in DOC_CACHE_POLICIES:
+            raise ValueError("Not a valid cache policy: %s" % cache_policy)
 
-        cpath = corpus_base_path(file_name)
-        fname = os.path.join(cpath, '%s_docs.json' % corpus_id)
+        self._cache = None
 
-        self._docs_stream = io.json.read_json(fname, lines=True)
+        if cache_policy == 'shared':
+            self._cache = shared_docs_cache
+        elif cache_policy != 'none':
+            self._cache = LRUCache(cache_size,
+                                   getsizeof=DOC_CACHE_POLICIES[cache_policy])
+
+        self._docs_path = corpus_docs_path(file_name, corpus_id)
         self._meta = load_corpus_metadata(file_name, corpus_id)
 
     def __iter__(self):
-        if self._use_cache:
-            return iter(self._cache)
+        return iter_docs(self._docs_path)
+
+    def _cache_key(self, position):
+        if self._cache is shared_docs_cache:
+            return (self.file_name, self.corpus_id, position)
+
+        return position
+
+    def get_doc(self, position):
+        """ Returns the document at the given position in the corpus
 
-        return self
+        The document is read directly from its position in the docs file,
+        using the docs index. Corpuses created without an index are streamed
+        until the document is reached.
+        """
 
-    def __next__(self):
-        try:
-            value = next(self._docs_stream)
-        except StopIteration:
-            self._use_cache = True
-            raise
+        if position < 0:
+            position += self.n_docs
+
+        if not 0 <= position < self.n_docs:
+            raise IndexError(position)
+
+        if self._cache is not None:
+            doc = self._cache.get(self._cache_key(position))
+
+            if doc is not None:
+                return doc
+
+        if os.path.exists(docs_index_path(self._docs_path)):
+            doc = read_doc(self._docs_path, position)
         else:
-            self._cache.append(value)
+            doc = next(islice(iter(self), position, None))
+
+        if self._cache is not None:
+            self._cache[self._cache_key(position)] = doc
+
+        return doc
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._get_slice(key)
+
+        return self.get_doc(key)
 
-        return value
+    def _get_slice(self, key):
+        """ Streams a slice of documents from the docs file
+
+        The documents are read forward from the first one, so they are not
+        kept in the cache, which is meant for documents read by position.
+        """
+
+        start, stop, step = key.indices(self.n_docs)
+
+        if step < 0:
+            return self._get_slice(slice(stop + 1, start + 1))[::step]
+
+        if start >= stop:
+            return []
+
+        docs = iter_docs(self._docs_path, start=start)
+
+        return list(islice(docs, 0, stop - start, step))
 
     @property
     def n_docs(self):
@@ -226,49 +345,99 @@ class Corpus(object):
         return self._meta['description']
 
 
+# Process wide registry of loaded corpuses, shared between requests. The keys
+# are (file_name, corpus_id, mtime of the docs file). The corpuses hold only
+# their metadata, their documents are kept in the shared_docs_cache
+corpus_registry = LRUCache(50)
+
+
+def invalidate_corpus(file_name, corpus_id):
+    """ Removes a corpus, and its cached documents, from the corpus registry
+    """
+
+    for key in corpus_registry.keys():
+        if key[:2] == (file_name, corpus_id):
+            corpus_registry.pop(key)
+
+    for key in shared_docs_cache.keys():
+        if key[:2] == (file_name, corpus_id):
+            shared_docs_cache.pop(key)
+
+
 def get_corpus(request, doc=None, corpus_id=None):
+    """ Returns a corpus, from the registry of already loaded corpuses
+
+    If the docs file of the corpus has changed, the corpus is loaded again.
+    Returns None if the corpus can't be found.
+    """
+
     if not (doc and corpus_id):
         doc, corpus_id = extract_corpus_id(request)
 
-    corpus = Corpus(file_name=doc, corpus_id=corpus_id)
+    if not (doc and corpus_id):
+        return None
+
+    try:
+        mtime = os.path.getmtime(corpus_docs_path(doc, corpus_id))
+    except OSError:
+        return None
+
+    key = (doc, corpus_id, mtime)
+    corpus = corpus_registry.get(key)
+
+    if corpus is None:
+        invalidate_corpus(doc, corpus_id)
+        corpus = Corpus(file_name=doc, corpus_id=corpus_id,
+                        cache_policy='shared')
+        corpus_registry[key] = corpus
 
     return corpus
 
 
+def rebuild_catalogue():
+    """ Adds all the corpuses found in the storage to the corpus catalogue
+    """
+
+    docs = [f for f in os.listdir(CORPUS_STORAGE) if f.endswith('.csv')]
+
+    for name in docs:
+        for corpus_id in available_corpus(name):
+            try:
+                meta = load_corpus_metadata(name, corpus_id)
+                info = (meta['title'], meta.get('description', ''),
+                        meta['statistics']['docs'])
+            except Exception:
+                logger.exception("Could not read the metadata of corpus %s "
+                                 "(%s)", corpus_id, name)
+
+                continue
+
+            register_corpus(name, corpus_id, *info)
+
+    mark_populated()
+
+
 def available_documents(request):
     """ Returns a list of available documents (ex: csv files) in the storage
+
+    The corpuses of each document are taken from the corpus catalogue, as
+    lightweight ``CorpusInfo`` objects.
     """
 
+    if not is_populated():
+        logger.info("Filling the corpus catalogue")
+        rebuild_catalogue()
+
+    catalogue = catalogue_corpuses()
     res = []
 
     docs = [f for f in os.listdir(CORPUS_STORAGE) if f.endswith('.csv')]
 
     for name in docs:
-        cpath = corpus_base_path(name)
-        corpuses = []
-
-        if os.path.exists(cpath):
-            files = defaultdict(list)
-
-            for fn in os.listdir(cpath):
-                if '_' not in fn:
-                    continue
-                base, spec = fn.split('_', 1)
-                files[base].append(spec)
-
-            for corpus, cfs in files.items():
-                if len(cfs) != len(('docs', 'info')):
-                    logger.warning("Not a valid corpus: %s (%s)", name, corpus)
-
-                    continue
-                corpus = get_corpus(request, doc=name, corpus_id=corpus)
-                corpuses.append(corpus)
-                # meta = load_corpus_metadata(name, corpus)
-                # corpuses.append((corpus, meta))
         d = {
             'title': name,
             'name': name,
-            'corpuses': corpuses
+            'corpuses': catalogue.get(name, [])
         }
         res.append(d)
 
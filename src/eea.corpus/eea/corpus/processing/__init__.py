@@ -1,23 +1,40 @@
+import glob
+import logging
+import os.path
+import time
 from collections import OrderedDict, namedtuple
-from itertools import zip_longest
 
 import colander
 import deform
 import venusian
 
-from eea.corpus.config import upload_location
+from eea.corpus.config import (CORPUS_STORAGE, STEP_CACHE_MAX_AGE,
+                               STEP_CACHE_MAX_SIZE, upload_location)
+from eea.corpus.processing.parallel import parallel_process
+from eea.corpus.processing.spill import SpillStore, spill_path
 from eea.corpus.processing.utils import (component_phash_id,
-                                         get_pipeline_for_component)
-from pandas import read_csv
+                                         get_pipeline_for_component,
+                                         run_process)
+from eea.corpus.storage import iter_docs
+from eea.corpus.utils import document_stream
+
+logger = logging.getLogger('eea.corpus')
 
 # container for registered pipeline components
 pipeline_registry = OrderedDict()
 
+# In preview mode, at most ``preview_size * PREVIEW_OVERREAD`` rows are read
+# from the uploaded document. This leaves room for components that filter
+# documents, without parsing the whole file when everything gets filtered.
+PREVIEW_OVERREAD = 10
+
 Processor = namedtuple('Processor',
-                       ['name', 'schema', 'process', 'title', 'actions'])
+                       ['name', 'schema', 'process', 'title', 'actions',
+                        'parallel', 'batch_size'])
 
 
-def pipeline_component(schema, title, actions=None):
+def pipeline_component(schema, title, actions=None, parallel=False,
+                       batch_size=None):
     """ Register a processing function as a pipeline component, with a schema
 
     A pipeline component is two pieces:
@@ -32,6 +49,26 @@ def pipeline_component(schema, title, actions=None):
     can be used to handle special cases that can't be foreseen by the main form
     views.
 
+    Pass ``parallel=True`` if the ``process`` function handles each document
+    independently, without keeping state between documents. Such components
+    can be run in worker processes, on batches of documents (see
+    ``eea.corpus.processing.parallel``). If that depends on the component
+    settings, pass a ``parallel(settings)`` function instead.
+
+    Pass a ``batch_size`` to register a batch component. Its ``process``
+    function reads a stream of lists of documents (of up to ``batch_size``
+    documents) and yields lists of documents, which allows the use of batched
+    back-ends, such as spaCy's ``nlp.pipe``:
+
+        @pipeline_component(schema=SomeSettingsSchema, title='Batch Pipe',
+                            batch_size=500)
+        def process(batches, env, **settings):
+            for docs in batches:
+                yield [do_something(doc) for doc in docs]
+
+    The pipeline runner takes care of grouping and flattening the documents
+    stream, so batch and per document components can be mixed in a pipeline.
+
     Use such as:
 
         class SomeSettingsSchema(colander.Schema):
@@ -79,7 +116,8 @@ def pipeline_component(schema, title, actions=None):
                     missing=uid,
                 )
 
-            p = Processor(uid, WrappedSchema, func, title, actions=[])
+            p = Processor(uid, WrappedSchema, func, title, actions=[],
+                          parallel=parallel, batch_size=batch_size)
             pipeline_registry[uid] = p
 
             return func
@@ -91,7 +129,112 @@ def pipeline_component(schema, title, actions=None):
     return decorator
 
 
-def build_pipeline(file_name, text_column, pipeline, preview_mode=True):
+def step_cache_path(file_name, phash_id):
+    """ Returns the path of the saved output of a pipeline step
+    """
+
+    # imported here, the corpus module depends on this one
+    from eea.corpus.corpus import corpus_base_path
+
+    return spill_path(corpus_base_path(file_name), phash_id, 'step')
+
+
+def is_fresh(path, document_path):
+    """ Check if a file derived from an uploaded document is up to date
+
+    Files older than the document have been derived from a previous upload
+    with the same name, they are removed.
+    """
+
+    if not os.path.exists(path):
+        return False
+
+    if os.path.getmtime(path) >= os.path.getmtime(document_path):
+        return True
+
+    logger.info("Removing stale file %s", path)
+
+    try:
+        os.unlink(path)
+    except OSError:     # removed meanwhile
+        pass
+
+    return False
+
+
+def clear_step_cache(file_name):
+    """ Removes all the saved steps outputs of an uploaded file
+    """
+
+    # imported here, the corpus module depends on this one
+    from eea.corpus.corpus import corpus_base_path
+
+    for path in glob.glob(os.path.join(corpus_base_path(file_name),
+                                       '*.step')):
+        os.unlink(path)
+
+
+def prune_step_cache(max_age=STEP_CACHE_MAX_AGE,
+                     max_size=STEP_CACHE_MAX_SIZE):
+    """ Removes the old saved steps outputs, of all the uploaded files
+
+    The outputs older than ``max_age`` seconds are removed, then the oldest
+    outputs, until their total size is at most ``max_size`` bytes.
+    """
+
+    files = []
+
+    for path in glob.glob(os.path.join(CORPUS_STORAGE, 'var', '*', '*.step')):
+        try:
+            st = os.stat(path)
+        except OSError:     # removed meanwhile
+            continue
+        files.append((st.st_mtime, st.st_size, path))
+
+    files.sort(reverse=True)     # newest first
+    now = time.time()
+    total = 0
+
+    for mtime, size, path in files:
+        total += size
+
+        if (now - mtime > max_age) or (total > max_size):
+            logger.info("Removing saved pipeline step %s", path)
+
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def _pipeline_stages(steps, parallel):
+    """ Groups the pipeline steps in stages, as a list of (in_pool, steps)
+
+    Consecutive steps that can run in worker processes are grouped in a single
+    stage, so the documents are sent only once to the worker processes.
+    """
+
+    stages = []
+
+    for step in steps:
+        in_pool = pipeline_registry[step[0]].parallel
+
+        if callable(in_pool):
+            in_pool = in_pool(step[2])
+
+        in_pool = parallel and in_pool
+
+        if in_pool and stages and stages[-1][0]:
+            stages[-1][1].append(step)
+        else:
+            stages.append((in_pool, [step]))
+
+    return stages
+
+
+def build_pipeline(file_name, text_column, pipeline, preview_mode=True,
+                   metadata_columns=None, preview_size=None, use_cache=False,
+                   processes=None):
     """ Runs file through pipeline and returns result
 
     A pipeline component:
@@ -105,21 +248,27 @@ def build_pipeline(file_name, text_column, pipeline, preview_mode=True):
 
     The yielded content can be statements, documents, etc.
 
+    The uploaded document is streamed in chunks, so the pipeline starts
+    producing content as soon as the first rows are parsed. Pass
+    ``metadata_columns`` to restrict the columns that are read as metadata.
+
+    When previewing, pass ``preview_size`` (the number of documents that will
+    be shown) to read only the first rows of the document, in chunks of that
+    size, up to a bounded number of rows (see ``PREVIEW_OVERREAD``).
+
+    With ``use_cache``, the output of each step is saved on disk, keyed by the
+    step ``phash_id``, and the pipeline resumes from the output of the last
+    saved step, instead of running again the steps before it. The output is
+    saved only when not previewing (the preview reads only the first rows)
+    and only when it is fully consumed. Saved outputs older than the uploaded
+    document are removed, and the size of all saved outputs is capped (see
+    ``prune_step_cache``).
+
+    With ``processes`` bigger than 1, the components registered as
+    ``parallel`` are run in a pool of that many worker processes, except when
+    previewing. The output order is preserved.
     """
     document_path = upload_location(file_name)
-    df = read_csv(document_path)
-
-    cs = iter(df[text_column])
-    df = df[df.columns.difference([text_column])]
-    ms = (dict(zip(df.keys(), row)) for row in df.values)
-    stream = zip_longest(cs, ms)
-
-    content_stream = (
-        dict(text=text, metadata=meta) for text, meta in stream
-        # strip rows where there's no text
-
-        if text and isinstance(text, str)
-    )
 
     env = {
         'file_name': file_name,
@@ -133,8 +282,8 @@ def build_pipeline(file_name, text_column, pipeline, preview_mode=True):
         # previous pipeline steps
         'step_id': None,
     }
-    # if not preview_mode:
-    #     import pdb; pdb.set_trace()
+
+    steps = []
 
     for (component_name, step_id, kwargs) in pipeline:
         env['step_id'] = step_id
@@ -145,14 +294,90 @@ def build_pipeline(file_name, text_column, pipeline, preview_mode=True):
         phash_id = component_phash_id(
             file_name, text_column, step_pipeline
         )
-        env['phash_id'] = phash_id
+        steps.append((component_name, step_id, kwargs, phash_id))
+
+    content_stream = None
 
-        component = pipeline_registry[component_name]
-        process = component.process
-        content_stream = process(content_stream, env, **kwargs)
+    if use_cache:
+        if not preview_mode:
+            prune_step_cache()
+
+        for i in reversed(range(len(steps))):
+            path = step_cache_path(file_name, steps[i][3])
+
+            if is_fresh(path, document_path):
+                logger.info("Pipeline for %s resumes from step %s",
+                            file_name, steps[i][1])
+                os.utime(path)      # pruned last, see prune_step_cache
+                content_stream = iter_docs(path)
+                steps = steps[i+1:]
+                break
+
+    if content_stream is None:
+        read_options = {}
+
+        if preview_mode and preview_size:
+            read_options = {
+                'chunksize': preview_size,
+                'nrows': preview_size * PREVIEW_OVERREAD,
+            }
+
+        content_stream = document_stream(document_path, text_column,
+                                         metadata_columns=metadata_columns,
+                                         **read_options)
+
+    parallel = not preview_mode and (processes or 1) > 1
+
+    for (in_pool, stage) in _pipeline_stages(steps, parallel):
+        calls = []
+
+        for (component_name, step_id, kwargs, phash_id) in stage:
+            # each step gets its own env: the processors are generators, they
+            # read the env only once the stream is consumed
+            step_env = dict(env, step_id=step_id, phash_id=phash_id)
+
+            component = pipeline_registry[component_name]
+            calls.append((component.process, step_env, kwargs,
+                          component.batch_size))
+
+        if in_pool:
+            content_stream = parallel_process(content_stream, calls,
+                                              processes)
+        else:
+            process, step_env, kwargs, batch_size = calls[0]
+            content_stream = run_process(process, content_stream, step_env,
+                                         kwargs, batch_size=batch_size)
+
+        if use_cache and not preview_mode:
+            # a stage run in worker processes is saved as a whole
+            path = step_cache_path(file_name, stage[-1][3])
+            content_stream = iter(SpillStore(path, content_stream))
 
     return content_stream
 
 
+class PipelineContent(object):
+    """ A re-iterable stream of the results of a pipeline
+
+    Each iteration runs the pipeline again, streaming the uploaded document.
+    This allows multiple passes over the pipeline results, without keeping
+    them in memory.
+    """
+
+    def __init__(self, file_name, text_column, pipeline, preview_mode=False,
+                 use_cache=False):
+        self.file_name = file_name
+        self.text_column = text_column
+        self.pipeline = pipeline
+        self.preview_mode = preview_mode
+        self.use_cache = use_cache
+
+    def __iter__(self):
+        return iter(build_pipeline(self.file_name, self.text_column,
+                                   self.pipeline,
+                                   preview_mode=self.preview_mode,
+                                   use_cache=self.use_cache))
+
+
 def includeme(config):      # pragma: no cover
     config.include('.phrases')
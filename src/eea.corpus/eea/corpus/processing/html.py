@@ -1,35 +1,138 @@
-""" Get the text from potential html strings using bs4
+""" Get the text from potential html strings
+
+The text can be extracted with BeautifulSoup, with a streaming parser that
+doesn't build a document tree or, if it is installed, with lxml. Texts that
+have no tags or entities are not parsed.
 """
 
 import logging
+from collections import OrderedDict
+from html.parser import HTMLParser
 
+import colander
+import deform.widget
 from bs4 import BeautifulSoup
-from colander import Schema
 
 from eea.corpus.processing import pipeline_component  # , needs_text_input
 from eea.corpus.utils import set_text
 
+try:
+    import lxml.html
+except ImportError:     # pragma: no cover
+    lxml = None
+
 logger = logging.getLogger('eea.corpus')
 
 
-class BeautifulSoupText(Schema):
-    """ Schema for BeautifulSoup based parser
+class TextCollector(HTMLParser):
+    """ Collects the text of an HTML document, without building a tree
+
+    The content of the script and style tags is skipped.
+    """
+
+    SKIP_TAGS = ('script', 'style')
+
+    def __init__(self):
+        super(TextCollector, self).__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def stream_text(html):
+    parser = TextCollector()
+    parser.feed(html)
+    parser.close()
+
+    return ''.join(parser.parts)
+
+
+def bs4_text(html):
+    return BeautifulSoup(html, 'html.parser').get_text()
+
+
+def lxml_text(html):
+    """ Returns the text of an HTML string, using lxml
+
+    As with the other backends, the content of the script and style tags is
+    skipped, and documents without elements (ex: only comments) have no text.
     """
-    description = "Uses BeautifulSoup to extract plain text from HTML content."
+
+    try:
+        document = lxml.html.fromstring(html)
+    except lxml.etree.ParserError:      # "Document is empty"
+        return ''
+
+    for el in list(document.iter(*TextCollector.SKIP_TAGS)):
+        el.drop_tree()
+
+    return document.text_content()
+
+
+# available backends, as name: (title, text extraction function)
+BACKENDS = OrderedDict([
+    ('stream', ('Streaming parser (fast)', stream_text)),
+    ('bs4', ('BeautifulSoup', bs4_text)),
+])
+
+if lxml is not None:
+    BACKENDS['lxml'] = ('lxml', lxml_text)
+
+
+def get_text(html, backend='bs4'):
+    """ Returns the text of an HTML string
+    """
+
+    # nothing to parse in plain text
+    if '<' not in html and '&' not in html:
+        return html
+
+    return BACKENDS[backend][1](html)
+
+
+class BeautifulSoupText(colander.Schema):
+    """ Schema for the HTML to text converter
+    """
+    description = "Extract plain text from HTML content."
+
+    backend = colander.SchemaNode(
+        colander.String(),
+        validator=colander.OneOf(list(BACKENDS)),
+        default='stream',
+        missing='stream',
+        title="Parser",
+        widget=deform.widget.SelectWidget(
+            values=[(k, v[0]) for k, v in BACKENDS.items()]
+        ),
+    )
 
 
 @pipeline_component(schema=BeautifulSoupText,
-                    title="Strip HTML tags")
+                    title="Strip HTML tags",
+                    parallel=True)
 def process(content, env, **settings):
 
+    # pipelines created before the backend choice used BeautifulSoup
+    backend = settings.get('backend', 'bs4')
+
     for doc in content:
         text = doc['text']
         try:
-            soup = BeautifulSoup(text, 'html.parser')
-            clean = soup.get_text()
+            clean = get_text(text, backend)
         except Exception:
             logger.exception(
-                "BS4 Processor: got an error in extracting content: %r",
+                "HTML Processor: got an error in extracting content: %r",
                 doc
             )
 
@@ -39,7 +142,7 @@ def process(content, env, **settings):
             yield set_text(doc, clean)
         except Exception:
             logger.exception(
-                "BS4 Processor: got an error converting to Doc: %r",
+                "HTML Processor: got an error converting to Doc: %r",
                 doc
             )
 
@@ -1,15 +1,125 @@
 import logging
+import os
+import pickle
+import time
+from collections import defaultdict, namedtuple
 
 import colander
 import deform.widget
+import spacy
 
-from eea.corpus.processing import pipeline_component
-from eea.corpus.utils import set_text, tokenize
-from textacy.doc import Doc
+from cytoolz import partition_all
+from eea.corpus.config import upload_location
+from eea.corpus.corpus import corpus_base_path
+from eea.corpus.processing import is_fresh, pipeline_component
+from eea.corpus.processing.spill import SPILL_CODEC, SPILL_FORMAT, spill_path
+from eea.corpus.processing.utils import (component_phash_id,
+                                         get_pipeline_for_component)
+from eea.corpus.storage import iter_docs, spill_docs
+from eea.corpus.utils import (FrequencyCounter, hashed_id, rand, set_text,
+                              tokenize)
 from textacy.extract import noun_chunks
+from textacy.text_utils import detect_language
 
 logger = logging.getLogger('eea.corpus')
 
+# Each document is parsed with the spaCy model of its (detected) language.
+# This model is used when the language can't be detected. Finding the noun
+# chunks needs only the tagger and the dependency parser.
+SPACY_MODEL = 'en'
+SPACY_DISABLE = ['ner']
+
+# number of documents parsed at once by spaCy
+NLP_BATCH_SIZE = 100
+
+# spaCy models are big and slow to load, they are loaded once per process.
+# The languages without a model are kept with a None value
+_nlp_models = {}
+
+# A noun chunk found in a document. It has the same attributes as the spaCy
+# spans, but it can be saved on disk
+Chunk = namedtuple('Chunk', ['start_char', 'end_char', 'text', 'lower_'])
+
+
+def get_nlp(lang=SPACY_MODEL):
+    """ Returns the shared spaCy model of a language, loading it if needed
+
+    Returns None if the model can't be loaded.
+    """
+
+    if lang not in _nlp_models:
+        logger.info("Loading spaCy model %s", lang)
+
+        try:
+            _nlp_models[lang] = spacy.load(lang, disable=SPACY_DISABLE)
+        except Exception:
+            logger.exception("Could not load the spaCy model %s", lang)
+            _nlp_models[lang] = None
+
+    return _nlp_models[lang]
+
+
+def detect_lang(text):
+    try:
+        return detect_language(text)
+    except Exception:
+        logger.exception("Could not detect the language of %r", text[:100])
+
+        return SPACY_MODEL
+
+
+def parse_texts(nlp, texts):
+    """ Parses texts in a batch. Returns a list of spaCy docs
+
+    If the batch can't be parsed, the texts are parsed one by one and None is
+    returned in place of the texts with errors.
+    """
+
+    try:
+        return list(nlp.pipe(texts, batch_size=len(texts)))
+    except Exception:
+        logger.exception("Noun chunks: error parsing a batch of texts")
+
+    res = []
+
+    for text in texts:
+        try:
+            res.append(nlp(text))
+        except Exception:
+            logger.exception("Noun chunks: error parsing %r", text)
+            res.append(None)
+
+    return res
+
+
+def parse_batch(texts):
+    """ Parses texts, each with the model of its language
+
+    The texts are grouped by language, each group is parsed in a batch.
+    Returns a list of spaCy docs, with None in place of the texts that can't
+    be parsed (ex: there's no model for their language).
+    """
+
+    groups = defaultdict(list)      # language: positions of texts
+
+    for i, text in enumerate(texts):
+        groups[detect_lang(text)].append(i)
+
+    res = [None] * len(texts)
+
+    for lang, positions in groups.items():
+        nlp = get_nlp(lang)
+
+        if nlp is None:
+            continue
+
+        parsed = parse_texts(nlp, [texts[i] for i in positions])
+
+        for i, sdoc in zip(positions, parsed):
+            res[i] = sdoc
+
+    return res
+
 
 class NounChunks(colander.Schema):
     """ Schema for the NounChunks processing.
@@ -47,10 +157,204 @@ class NounChunks(colander.Schema):
         default=1,
     )
 
+    SCOPES = (
+        ('document', 'Count the noun chunks in each document'),
+        ('corpus', 'Count the noun chunks in all the documents'),
+    )
+
+    freq_scope = colander.SchemaNode(
+        colander.String(),
+        validator=colander.OneOf([x[0] for x in SCOPES]),
+        default=SCOPES[0][0],
+        missing=SCOPES[0][0],
+        title="Frequency count scope",
+        description="Counting in all the documents needs an additional pass "
+        "through the documents, the first time.",
+        widget=deform.widget.RadioChoiceWidget(values=SCOPES)
+    )
+
+
+def tokenize_spans(text, spans):
+    """ Replaces the text of each span with its tokenized version
+
+    The spans are spaCy spans of the parsed text. The text is rewritten in a
+    single pass, using the spans character offsets. Spans overlapping a
+    previous span are ignored.
+    """
+
+    parts = []
+    pos = 0
+
+    for span in sorted(spans, key=lambda span: span.start_char):
+        start, end = span.start_char, span.end_char
+
+        if start < pos:
+            continue
+
+        parts.append(text[pos:start])
+        parts.append(tokenize(text[start:end]))
+        pos = end
+
+    parts.append(text[pos:])
+
+    return ''.join(parts)
+
+
+def extract_chunks(batches, drop_determiners, min_freq):
+    """ Parses batches of docs. Yields lists of (doc, [Chunk, ...])
+    """
+
+    count = 0
+    start = time.time()
+
+    for docs in batches:
+        parsed = parse_batch([doc['text'] for doc in docs])
+        res = []
+
+        for doc, sdoc in zip(docs, parsed):
+            if sdoc is None:
+                continue
+
+            try:
+                chunks = [
+                    Chunk(nc.start_char, nc.end_char, nc.text, nc.lower_)
+                    for nc in noun_chunks(sdoc,
+                                          drop_determiners=drop_determiners,
+                                          min_freq=min_freq)
+                ]
+            except Exception:
+                logger.exception("Error extracting noun chunks %r", doc)
+
+                continue
+
+            res.append((doc, chunks))
+
+        count += len(docs)
+
+        yield res
+
+    elapsed = time.time() - start
+
+    if count and elapsed:
+        logger.debug("Noun chunks: parsed %s docs, %.1f docs/sec",
+                     count, count / elapsed)
+
+
+def frequencies_path(env, drop_determiners):
+    """ Returns the path of the noun chunks counts for a pipeline step
+
+    The counts depend only on the previous pipeline steps and on dropping the
+    determiners, so they are shared by the steps that differ only in the
+    other settings.
+    """
+
+    prefix = get_pipeline_for_component(env)[:-1]
+    phash_id = component_phash_id(env['file_name'], env['text_column'],
+                                  prefix)
+    key = hashed_id([phash_id, drop_determiners])
+
+    return spill_path(corpus_base_path(env['file_name']), key, 'ncfreq')
+
+
+def load_frequencies(path):
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_frequencies(counter, path):
+    tmp_path = '%s.%s.tmp' % (path, rand(8))
+
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(counter, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.rename(tmp_path, path)
+
+
+def count_chunks(chunked, counter, fname):
+    """ Counts the chunks, while saving the (doc, chunks) stream in a file
+    """
+
+    def records():
+        for batch in chunked:
+            for doc, chunks in batch:
+                for chunk in chunks:
+                    counter.add(chunk.lower_)
+
+                yield {'doc': doc, 'chunks': [list(c) for c in chunks]}
+
+    for _ in spill_docs(records(), fname, codec=SPILL_CODEC,
+                        doc_format=SPILL_FORMAT):
+        pass
+
+
+def read_chunks(fname):
+    """ Reads the (doc, chunks) stream saved by ``count_chunks``
+    """
+
+    for record in iter_docs(fname):
+        yield record['doc'], [Chunk(*c) for c in record['chunks']]
+
+
+def _filter_chunks(chunked, counter, min_freq):
+    for batch in chunked:
+        yield [(doc, [c for c in chunks if counter[c.lower_] >= min_freq])
+               for doc, chunks in batch]
+
+
+def filter_corpus_frequency(chunked, env, drop_determiners, min_freq):
+    """ Filters the chunks by their frequency in all the documents
+
+    The counts are done in a first pass through the documents, saving their
+    chunks in a temporary file, then the chunks are filtered in a second pass.
+    Outside the preview, the counts are saved, keyed by the pipeline, so next
+    runs need a single pass. The saved counts are used only if they are newer
+    than the uploaded document.
+    """
+
+    path = frequencies_path(env, drop_determiners)
+    counter = None
+
+    if is_fresh(path, upload_location(env['file_name'])):
+        counter = load_frequencies(path)
+
+    if counter is not None:
+        yield from _filter_chunks(chunked, counter, min_freq)
+
+        return
+
+    logger.info("Noun chunks: counting the chunks for %s", path)
+
+    counter = FrequencyCounter()
+    tmp_path = '%s.%s.tmp' % (path, rand(8))
+
+    try:
+        count_chunks(chunked, counter, tmp_path)
+
+        # the preview sees only the first documents
+        if not env.get('preview_mode'):
+            save_frequencies(counter, path)
+
+        chunked = partition_all(NLP_BATCH_SIZE, read_chunks(tmp_path))
+        yield from _filter_chunks(chunked, counter, min_freq)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def is_parallel(settings):
+    # counting the noun chunks in all the documents needs all of them in
+    # a single process
+    return settings.get('freq_scope', 'document') == 'document'
+
 
 @pipeline_component(schema=NounChunks,
-                    title="Find and process noun chunks")
-def process(content, env, **settings):
+                    title="Find and process noun chunks",
+                    parallel=is_parallel,
+                    batch_size=NLP_BATCH_SIZE)
+def process(batches, env, **settings):
     """ Noun Chunks processing
     """
 
@@ -58,33 +362,34 @@ def process(content, env, **settings):
 
     drop_deter = settings['drop_determiners']
     min_freq = int(settings['min_freq'])
+    in_corpus = settings.get('freq_scope', 'document') == 'corpus'
 
-    for doc in content:
-        text = doc['text']
+    if in_corpus and min_freq > 1:
+        chunked = extract_chunks(batches, drop_deter, 1)
+        chunked = filter_corpus_frequency(chunked, env, drop_deter, min_freq)
+    else:
+        chunked = extract_chunks(batches, drop_deter, min_freq)
 
-        try:
-            td = Doc(text)
-            ncs = [x.text for x in noun_chunks(td,
-                                               drop_determiners=drop_deter,
-                                               min_freq=min_freq)]
-        except Exception:
-            logger.exception("Error extracting noun chunks %r", doc)
+    for batch in chunked:
+        res = []
 
-            continue
+        for doc, chunks in batch:
+            text = doc['text']
 
-        if mode == 'tokenize':
-            for nc in ncs:
-                text = text.replace(nc, tokenize(nc))
+            if mode == 'tokenize':
+                text = tokenize_spans(text, chunks)
 
-        if mode == 'append':
-            text = ' '.join([text] + [tokenize(nc) for nc in ncs])
+            if mode == 'append':
+                text = ' '.join([text] + [tokenize(nc.text) for nc in chunks])
 
-        if mode == 'replace':
-            text = ' '.join([tokenize(nc) for nc in ncs])
+            if mode == 'replace':
+                text = ' '.join([tokenize(nc.text) for nc in chunks])
 
-        try:
-            yield set_text(doc, text)
-        except Exception:
-            logger.exception("Error in converting to Doc %r", text)
+            try:
+                res.append(set_text(doc, text))
+            except Exception:
+                logger.exception("Error in converting to Doc %r", text)
 
-            continue
+                continue
+
+        yield res
@@ -0,0 +1,64 @@
+""" Running pipeline components in worker processes.
+
+The document stream is split in ordered batches. Each batch is run through a
+chain of pipeline components in a process pool, and the results are yielded in
+the order of the batches. Only components registered with ``parallel=True``
+(see ``eea.corpus.processing.pipeline_component``) are run this way: they need
+to process each document independently of the others, without keeping state
+between documents.
+"""
+
+import multiprocessing
+from collections import deque
+
+from cytoolz import partition_all
+from eea.corpus.processing.utils import run_process
+
+# number of documents sent at once to a worker process
+PARALLEL_BATCH_SIZE = 200
+
+# number of batches waiting to be processed, per worker process. This keeps
+# the memory usage bounded when the documents are read faster than processed
+PARALLEL_QUEUE_SIZE = 2
+
+
+def process_batch(args):
+    """ Runs a batch of docs through a chain of pipeline components
+
+    The ``args`` is a tuple of (calls, docs), where calls is a list of
+    (process, env, settings, batch_size) for each component.
+    """
+
+    calls, docs = args
+    stream = iter(docs)
+
+    for process, env, settings, batch_size in calls:
+        stream = run_process(process, stream, env, settings,
+                             batch_size=batch_size)
+
+    return list(stream)
+
+
+def parallel_process(content, calls, processes,
+                     batch_size=PARALLEL_BATCH_SIZE):
+    """ Runs content through a chain of pipeline components, in a process pool
+
+    The output has the same order as with running the components in the
+    current process. The batches are at least as big as the ``batch_size`` of
+    the batch components.
+    """
+
+    sizes = [call[3] for call in calls if call[3] is not None]
+    batch_size = max([batch_size] + sizes)
+
+    with multiprocessing.Pool(processes) as pool:
+        pending = deque()
+
+        for batch in partition_all(batch_size, content):
+            pending.append(pool.apply_async(process_batch, ((calls, batch),)))
+
+            if len(pending) >= processes * PARALLEL_QUEUE_SIZE:
+                yield from pending.popleft().get()
+
+        while pending:
+            yield from pending.popleft().get()
@@ -2,9 +2,13 @@ import logging
 import os.path
 
 from eea.corpus.async import queue
+from eea.corpus.config import PIPELINE_STEP_CACHE, upload_location
 from eea.corpus.corpus import corpus_base_path
-from eea.corpus.processing import build_pipeline
-from eea.corpus.processing.phrases.phrases import build_phrase_models
+from eea.corpus.processing import PipelineContent, is_fresh
+from eea.corpus.processing.phrases.phrases import (TokenizedContent,
+                                                   build_phrase_models)
+from eea.corpus.processing.spill import SpillStore, spill_path
+from eea.corpus.processing.utils import component_phash_id
 from rq.decorators import job
 
 logger = logging.getLogger('eea.corpus')
@@ -17,6 +21,9 @@ logger = logging.getLogger('eea.corpus')
 )
 def build_phrases(pipeline, file_name, text_column, phash_id, settings):
     """ Async job to build a phrase models using the provided pipeline
+
+    The tokenized sentences are saved in a ``.sents`` spill file, which is
+    removed once the phrase models are saved.
     """
 
     base_path = corpus_base_path(file_name)
@@ -24,9 +31,23 @@ def build_phrases(pipeline, file_name, text_column, phash_id, settings):
 
     pipeline = pipeline[:-1]  # last is phrases
 
-    content = build_pipeline(
-        file_name, text_column, pipeline, preview_mode=False
-    )
+    # the phrase models building needs multiple passes through the content.
+    # The tokenized sentences are saved on disk in the first pass, keyed by
+    # the pipeline that produces them, then replayed
+    content = PipelineContent(file_name, text_column, pipeline,
+                              use_cache=PIPELINE_STEP_CACHE)
+    tokens_id = component_phash_id(file_name, text_column, pipeline)
+    sents_path = spill_path(base_path, tokens_id, 'sents')
+
+    # a spill file left from a previous upload is removed
+    is_fresh(sents_path, upload_location(file_name))
+
+    sentences = SpillStore(sents_path, TokenizedContent(content))
 
     logger.info("Phrase processor: producing phrase model %s", cache_path)
-    build_phrase_models(content, cache_path, settings)
+
+    try:
+        build_phrase_models(sentences, cache_path, settings)
+    finally:
+        if os.path.exists(sents_path):
+            os.unlink(sents_path)
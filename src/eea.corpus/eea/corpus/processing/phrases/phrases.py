@@ -1,42 +1,140 @@
-from eea.corpus.utils import set_text
-from gensim.models.phrases import Phrases
-from itertools import chain, tee
+from cytoolz import partition_all
+from eea.corpus.processing.noun_chunks import NLP_BATCH_SIZE, parse_batch
+from eea.corpus.processing.phrases.utils import frozen_model_path
+from eea.corpus.utils import LRUCache, set_text
+from gensim.models.phrases import Phraser, Phrases
 import logging
+import os.path
 
 logger = logging.getLogger('eea.corpus')
 
+# Loaded (and frozen) phrase models, shared by all the documents and requests
+# processed by this process. Keyed by path, the values are (mtime, model)
+phrase_models_cache = LRUCache(20)
 
-def build_phrase_models(content, base_path, settings):
+
+def tokenize_docs(docs):
+    """ Returns the sentences of each of the docs, as lists of words
+
+    The texts of the docs are parsed in a batch, with the shared spaCy models
+    (see ``eea.corpus.processing.noun_chunks.parse_batch``). The docs that
+    can't be parsed have no sentences.
+    """
+
+    parsed = iter(parse_batch([doc['text'] for doc in docs
+                               if isinstance(doc, dict)]))
+    res = []
+
+    for doc in docs:
+        if not isinstance(doc, dict):       # a textacy Doc
+            res.append(doc.tokenized_text)
+
+            continue
+
+        sdoc = next(parsed)
+
+        if sdoc is None:
+            res.append([])
+
+            continue
+
+        res.append([[token.text for token in sent] for sent in sdoc.sents])
+
+    return res
+
+
+def tokenized_sentences(doc):
+    """ Returns the sentences of a document, as lists of words
+    """
+
+    return tokenize_docs([doc])[0]
+
+
+class TokenizedContent(object):
+    """ A re-iterable stream of the tokenized sentences of docs in content
+
+    The docs are tokenized in batches of ``NLP_BATCH_SIZE``.
+    """
+
+    def __init__(self, content):
+        self.content = content
+
+    def __iter__(self):
+        for docs in partition_all(NLP_BATCH_SIZE, self.content):
+            for sentences in tokenize_docs(docs):
+                yield from sentences
+
+
+def phrased_sentences(sentences, models):
+    """ Streams the sentences, with phrases from models applied
+    """
+
+    for sentence in sentences:
+        for model in models:
+            sentence = model[sentence]
+        yield sentence
+
+
+def build_phrase_models(sentences, base_path, settings):
     """ Build and save the phrase models
+
+    The sentences (lists of words) are streamed once for each n-gram level, so
+    they need to be re-iterable (for example, a list or a ``SpillStore``).
+    This way they never need to be kept in memory.
     """
 
     ngram_level = int(settings['level'])
-
-    # According to tee() docs, this may be inefficient in terms of memory.
-    # We need to do this because we need multiple passes through the
-    # content stream.
-    content = chain.from_iterable(doc.tokenized_text for doc in content)
-    cs1, cs2 = tee(content, 2)
+    models = []
 
     for i in range(ngram_level-1):
-        phrases = Phrases(cs1)
+        # tokenize the phrases of the previous levels in sentences stream
+        phrases = Phrases(phrased_sentences(sentences, models))
         path = "%s.%s" % (base_path, i + 2)     # save path as n-gram level
         logger.info("Phrase processor: Saving %s", path)
         phrases.save(path)
-        # TODO: gensim complains about not using Phraser(phrases)
-        content = phrases[cs2]  # tokenize phrases in content stream
-        cs1, cs2 = tee(content, 2)
+
+        # the frozen model keeps only the phrases, it is smaller and faster
+        phraser = Phraser(phrases)
+        phraser.save(frozen_model_path(path))
+        models.append(phraser)
+
+
+def load_phrase_model(fpath):
+    """ Returns the phrase model saved at fpath, frozen as a Phraser
+
+    The frozen export of the model is used, if it exists. The model is loaded
+    only once per process, then it is reused until the file is changed.
+    """
+
+    mtime = os.path.getmtime(fpath)
+    cached = phrase_models_cache.get(fpath)
+
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    frozen_path = frozen_model_path(fpath)
+
+    if os.path.exists(frozen_path):
+        logger.info("Phrase processor: loading phrase model %s", frozen_path)
+        model = Phraser.load(frozen_path)
+    else:
+        logger.info("Phrase processor: loading phrase model %s", fpath)
+        model = Phraser(Phrases.load(fpath))
+    phrase_models_cache[fpath] = (mtime, model)
+
+    return model
 
 
 def use_phrase_models(content, files, settings):
 
-    for doc in content:
-        text = doc.tokenized_text
-        for fpath in files:
-            phrases = Phrases.load(fpath)
-            text = phrases[text]
+    models = [load_phrase_model(fpath) for fpath in files]
+
+    for docs in partition_all(NLP_BATCH_SIZE, content):
+        for doc, text in zip(docs, tokenize_docs(docs)):
+            for phrases in models:
+                text = phrases[text]
 
-        text = ". ".join([" ".join(sent) for sent in text])
-        yield set_text(doc, text)
+            text = ". ".join([" ".join(sent) for sent in text])
+            yield set_text(doc, text)
 
     # TODO: implement filtering modes based on phrases
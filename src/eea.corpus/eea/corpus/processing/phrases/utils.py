@@ -1,4 +1,5 @@
 import os
+import re
 import time
 
 from eea.corpus.async import get_assigned_job
@@ -11,19 +12,26 @@ def phrase_model_files(base_path, phash_id):
     The phrase model files are a series of incrementally sufixed numbered files
     """
 
-    base_name = '%s.phras' % phash_id
+    pattern = re.compile(r'^%s\.phras\.\d+$' % re.escape(phash_id))
 
     # TODO: test that the phrase model file is "finished"
 
     files = []
 
     for name in sorted(os.listdir(base_path)):
-        if (name != base_name) and name.startswith(base_name):
+        if pattern.match(name):
             files.append(os.path.join(base_path, name))
 
     return files
 
 
+def frozen_model_path(fpath):
+    """ Returns the path of the frozen (Phraser) export of a phrase model
+    """
+
+    return fpath + '.frozen'
+
+
 def get_job_finish_status(phash_id, timeout=100):
     """ Wait for the job to finish or abort if job is unable to finish
 
@@ -95,7 +95,8 @@ class TextacyPreprocess(Schema):
 
 @pipeline_component(
     schema=TextacyPreprocess,
-    title="Textacy Preprocessing"
+    title="Textacy Preprocessing",
+    parallel=True,
 )
 def process(content, env, **settings):
     for doc in content:
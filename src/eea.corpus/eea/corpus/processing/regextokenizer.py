@@ -1,13 +1,52 @@
 import logging
 import re
+from collections import OrderedDict
 
 import colander
+import deform.widget
 
 from eea.corpus.processing import pipeline_component
-from eea.corpus.utils import set_text
+from eea.corpus.utils import LRUCache, set_text
+
+try:
+    import regex as regex_module
+except ImportError:     # pragma: no cover
+    regex_module = None
+
+try:
+    import re2
+except ImportError:     # pragma: no cover
+    re2 = None
 
 logger = logging.getLogger('eea.corpus')
 
+# available regular expression engines, as name: (title, compile function)
+ENGINES = OrderedDict([
+    ('re', ('Python (re)', re.compile)),
+])
+
+if regex_module is not None:
+    ENGINES['regex'] = ('regex module', regex_module.compile)
+
+if re2 is not None:
+    ENGINES['re2'] = ('RE2 (linear time, no backreferences)', re2.compile)
+
+# compiled patterns, shared by the pipelines that run in a process
+patterns_cache = LRUCache(100)
+
+
+def compile_pattern(pattern, engine='re'):
+    """ Returns the compiled pattern, using the given engine
+    """
+
+    key = (engine, pattern)
+    compiled = patterns_cache.get(key)
+
+    if compiled is None:
+        compiled = patterns_cache[key] = ENGINES[engine][1](pattern)
+
+    return compiled
+
 
 class RegexTokenizer(colander.Schema):
     """ Schema for the Tokenizer processing.
@@ -24,24 +63,48 @@ class RegexTokenizer(colander.Schema):
         default=r'[\w\']+|[""!"#$%&\'()*+,-./:;<=>?@[\]^_`{|}~""\\]',
     )
 
+    engine = colander.SchemaNode(
+        colander.String(),
+        validator=colander.OneOf(list(ENGINES)),
+        default='re',
+        missing='re',
+        title="Regular expression engine",
+        widget=deform.widget.SelectWidget(
+            values=[(k, v[0]) for k, v in ENGINES.items()]
+        ),
+    )
+
+    def validator(self, node, cstruct):
+        engine = cstruct.get('engine') or 're'
 
-def tokenizer(text, regex):
+        try:
+            compile_pattern(cstruct.get('regex') or '', engine)
+        except Exception as e:
+            exc = colander.Invalid(node)
+            exc['regex'] = "Not a valid regular expression: %s" % e
+            raise exc
+
+
+def tokenizer(text, regex, engine='re'):
     """ Tokenizes text. Returns lists of tokens (words)
     """
 
-    return [x for x in re.findall(regex, text) if x]
+    pattern = compile_pattern(regex, engine)
+
+    return [x for x in pattern.findall(text) if x]
 
 
 @pipeline_component(schema=RegexTokenizer,
-                    title="Regex based tokenizer")
+                    title="Regex based tokenizer",
+                    parallel=True)
 def process(content, env, **settings):
     """ Tokenization
     """
 
-    regex = settings['regex']
+    pattern = compile_pattern(settings['regex'], settings.get('engine', 're'))
 
     for doc in content:
-        text = " ".join(tokenizer(doc['text'], regex))
+        text = " ".join(x for x in pattern.findall(doc['text']) if x)
 
         try:
             yield set_text(doc, text)
@@ -16,7 +16,8 @@ class Tokenizer(Schema):
 
 
 @pipeline_component(schema=Tokenizer,
-                    title="Simple text tokenization")
+                    title="Simple text tokenization",
+                    parallel=True)
 def process(content, env, **settings):
     """ Tokenization
     """
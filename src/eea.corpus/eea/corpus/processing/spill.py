@@ -0,0 +1,68 @@
+""" On-disk spill store, for components that need multiple passes over their
+content.
+
+Some processing (for example, building the phrase models) needs several passes
+through a stream that is expensive to produce, like the tokenized sentences of
+the pipeline results. A ``SpillStore`` saves the stream to disk while it is
+consumed the first time, then replays it from disk.
+
+Spill files are saved in the corpus storage, named after the ``phash_id`` of
+the pipeline that produced them (see
+``eea.corpus.processing.utils.component_phash_id``), so they are shared by all
+jobs that use the same pipeline.
+"""
+
+import logging
+import os
+
+from eea.corpus.storage import CODECS, FORMATS, iter_docs, spill_docs
+from eea.corpus.utils import rand
+
+logger = logging.getLogger('eea.corpus')
+
+# spill files favour speed over size
+SPILL_CODEC = 'lz4' if 'lz4' in CODECS else 'gzip'
+SPILL_FORMAT = 'msgpack' if 'msgpack' in FORMATS else 'json'
+
+
+def spill_path(base_path, phash_id, kind):
+    """ Returns the path of a spill file, ex: <base_path>/<phash_id>.<kind>
+    """
+
+    return os.path.join(base_path, '%s.%s' % (phash_id, kind))
+
+
+class SpillStore(object):
+    """ A re-iterable stream that is saved on disk on its first iteration
+
+    The ``source`` is iterated only if there's no spill file at ``path``. The
+    spill file is written only if the source stream is fully consumed.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+
+    @property
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def __iter__(self):
+        if self.exists:
+            return iter_docs(self.path)
+
+        return self._spill()
+
+    def _spill(self):
+        tmp_path = '%s.%s.tmp' % (self.path, rand(8))
+        logger.info("Spill store: writing %s", self.path)
+
+        try:
+            yield from spill_docs(self.source, tmp_path, codec=SPILL_CODEC,
+                                  doc_format=SPILL_FORMAT)
+        except BaseException:
+            # also when the stream is not fully consumed
+            os.unlink(tmp_path)
+            raise
+
+        os.rename(tmp_path, self.path)
@@ -2,12 +2,14 @@
 """
 
 import logging
+import re
+from collections import OrderedDict
 
-from colander import Schema
-
+import colander
+import deform.widget
 import nltk
 from eea.corpus.processing import pipeline_component  # , needs_text_input
-from eea.corpus.utils import set_text
+from eea.corpus.utils import set_text, tokenizer
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 
@@ -30,20 +32,146 @@ except Exception:
     logger.exception("Error when checking for nltk's stopwords data")
 
 
-class StopWords(Schema):
-    """ Schema for BeautifulSoup based parser
+# The EU official languages that have a NLTK stopwords list
+LANGUAGES = (
+    ('danish', 'Danish'),
+    ('dutch', 'Dutch'),
+    ('english', 'English'),
+    ('finnish', 'Finnish'),
+    ('french', 'French'),
+    ('german', 'German'),
+    ('greek', 'Greek'),
+    ('hungarian', 'Hungarian'),
+    ('italian', 'Italian'),
+    ('portuguese', 'Portuguese'),
+    ('romanian', 'Romanian'),
+    ('slovene', 'Slovene'),
+    ('spanish', 'Spanish'),
+    ('swedish', 'Swedish'),
+)
+
+# Splits text in words and punctuation, close to what NLTK's word_tokenize
+# does, at a fraction of the cost
+WORDS_REGEX = re.compile(r'\w+|[^\w\s]+')
+
+
+def regex_tokenize(text):
+    return WORDS_REGEX.findall(text)
+
+
+# available tokenizers, as name: (title, tokenize function)
+TOKENIZERS = OrderedDict([
+    ('regex', ('Fast, regular expression based', regex_tokenize)),
+    ('simple', ('Simple (lowercase, drops numbers and short words)',
+                tokenizer)),
+    ('nltk', ("NLTK's word_tokenize (slow)", word_tokenize)),
+])
+
+
+# stopwords of each language, loaded once per process
+_language_stopwords = {}
+
+
+def language_stopwords(language):
+    """ Returns the stopwords of a language, as a frozenset
+    """
+
+    stops = _language_stopwords.get(language)
+
+    if stops is None:
+        try:
+            stops = frozenset(stopwords.words(language))
+        except (OSError, LookupError):
+            logger.warning("No stopwords list for language %s", language)
+            stops = frozenset()
+
+        _language_stopwords[language] = stops
+
+    return stops
+
+
+def parse_stopwords(text):
+    """ Parses a list of stopwords, separated by spaces, commas or new lines
+    """
+
+    return frozenset(w for w in re.split(r'[\s,]+', text or '') if w)
+
+
+def get_stopwords(languages=('english', ), custom=''):
+    """ Returns the set of stopwords for the given languages and custom list
+    """
+
+    stops = frozenset().union(*[language_stopwords(lang)
+                                for lang in languages])
+
+    return stops | parse_stopwords(custom)
+
+
+def sorted_list(value):
+    """ Converts the languages set to a sorted list
+
+    The settings are saved as JSON in the corpus metadata and are hashed in
+    the corpus id, so they need a stable, serializable value.
     """
-    description = "Filter our common English stopwords"
+
+    if value is colander.null:
+        return value
+
+    return sorted(value)
+
+
+class StopWords(colander.Schema):
+    """ Schema for the stopwords filter
+    """
+    description = "Filter out common stopwords"
+
+    languages = colander.SchemaNode(
+        colander.Set(),
+        preparer=sorted_list,
+        validator=colander.Length(min=1),
+        default=['english'],
+        missing=['english'],
+        title="Languages",
+        widget=deform.widget.CheckboxChoiceWidget(values=LANGUAGES,
+                                                  inline=True),
+    )
+
+    custom_stopwords = colander.SchemaNode(
+        colander.String(),
+        default='',
+        missing='',
+        title="Custom stopwords",
+        description="Additional words to remove, separated by spaces or "
+        "commas",
+        widget=deform.widget.TextAreaWidget(rows=3),
+    )
+
+    tokenizer = colander.SchemaNode(
+        colander.String(),
+        validator=colander.OneOf(list(TOKENIZERS)),
+        default='regex',
+        missing='regex',
+        title="Tokenizer",
+        description="Splits the text in words, before removing the stopwords",
+        widget=deform.widget.SelectWidget(
+            values=[(k, v[0]) for k, v in TOKENIZERS.items()]
+        ),
+    )
 
 
 @pipeline_component(schema=StopWords,
-                    title="Remove stop words")
+                    title="Remove stop words",
+                    parallel=True)
 def process(content, env, **settings):
-    stops = stopwords.words('english')
+    stops = get_stopwords(settings.get('languages', ('english', )),
+                          settings.get('custom_stopwords', ''))
+
+    # pipelines created before the tokenizer choice used NLTK
+    tokenize = TOKENIZERS[settings.get('tokenizer', 'nltk')][1]
 
     for doc in content:
 
-        words = word_tokenize(doc['text'])
+        words = tokenize(doc['text'])
         text = [w for w in words if w not in stops]
         text = " ".join(text)
 
@@ -1,3 +1,4 @@
+from cytoolz import concat, partition_all
 from eea.corpus.utils import hashed_id
 
 
@@ -10,7 +11,11 @@ def component_phash_id(file_name, text_column, pipeline):
             settings = settings.copy()
             settings.pop('schema_position', None)
             settings.pop('schema_type', None)
-            settings = sorted(settings.items())
+            # sets (ex: from colander.Set fields) have no stable order
+            settings = sorted(
+                (k, sorted(v) if isinstance(v, (set, frozenset)) else v)
+                for k, v in settings.items()
+            )
         salt.append((name, settings))
     return hashed_id(salt)
 
@@ -34,3 +39,19 @@ def get_pipeline_for_component(env):
             break
 
     return pipeline
+
+
+def run_process(process, content, env, settings, batch_size=None):
+    """ Runs a stream of docs through a component ``process`` function
+
+    With a ``batch_size``, the ``process`` is a batch component: the docs are
+    grouped in lists of that size, fed to the process, and the yielded lists
+    of docs are flattened back into a stream of docs.
+    """
+
+    if batch_size is None:
+        return process(content, env, **settings)
+
+    batches = (list(batch) for batch in partition_all(batch_size, content))
+
+    return concat(process(batches, env, **settings))
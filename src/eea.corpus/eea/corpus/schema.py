@@ -2,9 +2,10 @@ import colander
 import deform
 from colander import Float, Int, Schema, SchemaNode, Set, String
 
-import pandas as pd
 from eea.corpus.config import upload_location
 from eea.corpus.processing import pipeline_registry
+from eea.corpus.storage import CODECS, FORMATS
+from eea.corpus.utils import document_columns
 
 
 class Store(dict):
@@ -18,12 +19,13 @@ tmpstore = Store()
 def csv_file_columns(request):
     md = request.matchdict or {}
     name = md.get('doc')
+    columns = []
 
     if name:
-        path = upload_location(name)        # TODO: move this to utils
-        f = pd.read_csv(path)
+        path = upload_location(name)
+        columns = document_columns(path)
 
-    return [(k, k) for k in f.keys()]
+    return [(k, k) for k in columns]
 
 
 @colander.deferred
@@ -161,6 +163,30 @@ class CreateCorpusSchema(colander.MappingSchema):
         title='Text column in CSV file',
     )
 
+    codec = SchemaNode(
+        String(),
+        validator=colander.OneOf(list(CODECS)),
+        default='gzip',
+        missing='gzip',
+        title='Storage compression',
+        description='Compression used to save the corpus documents',
+        widget=deform.widget.SelectWidget(
+            values=[(name, name) for name in CODECS]
+        ),
+    )
+
+    doc_format = SchemaNode(
+        String(),
+        validator=colander.OneOf(list(FORMATS)),
+        default='json',
+        missing='json',
+        title='Storage format',
+        description='Format used to save the corpus documents',
+        widget=deform.widget.SelectWidget(
+            values=[(name, name) for name in FORMATS]
+        ),
+    )
+
     pipeline_components = SchemaNode(
         String(),
         missing='',
@@ -0,0 +1,332 @@
+""" Reading and writing of corpus docs files.
+
+A docs file is written together with an index file, holding the byte offset
+of each document, so that any document can be read without decoding the
+previous documents.
+
+Uncompressed JSON docs files are plain JSON lines files, one document per
+line.
+
+The other docs files (compressed or in a binary format) start with a header
+line that identifies the codec and the documents format::
+
+    EEACORPUS {"codec": "gzip", "format": "msgpack"}
+
+It is followed by blocks of documents. Each block holds up to
+``DOCS_PER_BLOCK`` serialized documents, compressed independently, and is
+prefixed by its compressed size. The index of such a docs file holds, for
+each document, the offset of its block. The codec and format are detected
+from the header, so reading a docs file doesn't need to know how it was
+written.
+"""
+
+import gzip
+import json
+import os.path
+import struct
+from collections import OrderedDict
+from itertools import islice
+
+try:
+    import zstandard
+except ImportError:     # pragma: no cover
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:     # pragma: no cover
+    lz4 = None
+
+try:
+    import msgpack
+except ImportError:     # pragma: no cover
+    msgpack = None
+
+
+MAGIC = b'EEACORPUS '
+
+# number of documents compressed together, in a block
+DOCS_PER_BLOCK = 100
+
+# byte offsets are saved as unsigned 64bit little endian integers
+INDEX_ENTRY = struct.Struct('<Q')
+
+# the compressed size of a block
+BLOCK_SIZE = struct.Struct('<I')
+
+
+def _identity(data):
+    return data
+
+
+def _zstd_compress(data):
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# available codecs, as name: (compress, decompress)
+CODECS = OrderedDict([
+    ('none', (_identity, _identity)),
+    ('gzip', (gzip.compress, gzip.decompress)),
+])
+
+if zstandard is not None:
+    CODECS['zstd'] = (_zstd_compress, _zstd_decompress)
+
+if lz4 is not None:
+    CODECS['lz4'] = (lz4.frame.compress, lz4.frame.decompress)
+
+
+def docs_index_path(docs_path):
+    """ Returns the path of the byte offsets index for a docs file
+    """
+
+    return os.path.splitext(docs_path)[0] + '.idx'
+
+
+def _encode_doc(doc):
+    line = json.dumps(doc, ensure_ascii=False, separators=(',', ':'))
+
+    return line.encode('utf-8') + b'\n'
+
+
+def _decode_doc(line):
+    return json.loads(line.decode('utf-8'))
+
+
+def _json_encode(docs):
+    return b''.join(_encode_doc(doc) for doc in docs)
+
+
+def _json_decode(data):
+    return [_decode_doc(line) for line in data.splitlines()]
+
+
+def _msgpack_encode(docs):
+    return b''.join(msgpack.packb(doc, use_bin_type=True) for doc in docs)
+
+
+def _msgpack_decode(data):
+    unpacker = msgpack.Unpacker(raw=False)
+    unpacker.feed(data)
+
+    return list(unpacker)
+
+
+# available documents formats, as name: (encode block, decode block)
+FORMATS = OrderedDict([
+    ('json', (_json_encode, _json_decode)),
+])
+
+if msgpack is not None:
+    FORMATS['msgpack'] = (_msgpack_encode, _msgpack_decode)
+
+
+def _write_block(f, docs, compress, encode):
+    data = compress(encode(docs))
+    f.write(BLOCK_SIZE.pack(len(data)))
+    f.write(data)
+
+
+def write_docs(docs, fname, codec='none', doc_format='json'):
+    """ Writes docs to a docs file, with a byte offset index
+
+    The ``codec`` is one of the names in ``CODECS`` and ``doc_format`` one of
+    the names in ``FORMATS``.
+    """
+
+    if codec not in CODECS:
+        raise ValueError("Not an available codec: %s" % codec)
+
+    if doc_format not in FORMATS:
+        raise ValueError("Not an available format: %s" % doc_format)
+
+    index = bytearray()
+
+    with open(fname, 'wb') as f:
+        if (codec, doc_format) == ('none', 'json'):
+            for doc in docs:
+                index += INDEX_ENTRY.pack(f.tell())
+                f.write(_encode_doc(doc))
+        else:
+            compress = CODECS[codec][0]
+            encode = FORMATS[doc_format][0]
+            _write_header(f, codec, doc_format)
+
+            block = []
+
+            for doc in docs:
+                index += INDEX_ENTRY.pack(f.tell())
+                block.append(doc)
+
+                if len(block) == DOCS_PER_BLOCK:
+                    _write_block(f, block, compress, encode)
+                    block = []
+
+            if block:
+                _write_block(f, block, compress, encode)
+
+    with open(docs_index_path(fname), 'wb') as f:
+        f.write(index)
+
+
+def _write_header(f, codec, doc_format):
+    header = json.dumps({'codec': codec, 'format': doc_format})
+    f.write(MAGIC + header.encode('ascii') + b'\n')
+
+
+def spill_docs(docs, fname, codec='none', doc_format='json'):
+    """ Streams docs through, while writing them to a docs file
+
+    The docs file is written in blocks, without an index. It is complete only
+    once the docs stream is exhausted. Use ``iter_docs`` to read it.
+    """
+
+    compress = CODECS[codec][0]
+    encode = FORMATS[doc_format][0]
+
+    with open(fname, 'wb') as f:
+        _write_header(f, codec, doc_format)
+
+        block = []
+
+        for doc in docs:
+            block.append(doc)
+
+            if len(block) == DOCS_PER_BLOCK:
+                _write_block(f, block, compress, encode)
+                block = []
+
+            yield doc
+
+        if block:
+            _write_block(f, block, compress, encode)
+
+
+def _read_header(f):
+    """ Returns a function that reads a block of docs from an open docs file
+
+    Returns None for plain JSON lines docs files. The file position is left
+    at the start of the first document (or block).
+    """
+
+    if f.read(len(MAGIC)) != MAGIC:
+        f.seek(0)
+
+        return None
+
+    header = json.loads(f.readline().decode('ascii'))
+    codec = header['codec']
+    doc_format = header.get('format', 'json')
+
+    if codec not in CODECS:
+        raise ValueError("Codec %s is not available" % codec)
+
+    if doc_format not in FORMATS:
+        raise ValueError("Format %s is not available" % doc_format)
+
+    decompress = CODECS[codec][1]
+    decode = FORMATS[doc_format][1]
+
+    def read_block(f):
+        """ Reads a block of docs from the current file position
+        """
+
+        size = f.read(BLOCK_SIZE.size)
+
+        if len(size) != BLOCK_SIZE.size:
+            return None
+
+        size, = BLOCK_SIZE.unpack(size)
+
+        return decode(decompress(f.read(size)))
+
+    return read_block
+
+
+def _read_docs(f, read_block):
+    """ Streams the documents from the current position of an open docs file
+    """
+
+    if read_block is None:
+        for line in f:
+            yield _decode_doc(line)
+
+        return
+
+    while True:
+        docs = read_block(f)
+
+        if docs is None:
+            return
+
+        yield from docs
+
+
+def _doc_offset(fname, position):
+    """ Returns (offset, index in block) of a document, from the docs index
+
+    For plain JSON lines docs files, the index in block is always 0. Raises
+    IndexError if there's no such document.
+    """
+
+    # read the index entry of the document, and the entries before it, up to
+    # a block size, to find the position of the document in its block
+    start = max(0, position - DOCS_PER_BLOCK + 1)
+
+    with open(docs_index_path(fname), 'rb') as f:
+        f.seek(start * INDEX_ENTRY.size)
+        entries = f.read((position - start + 1) * INDEX_ENTRY.size)
+
+    if len(entries) != (position - start + 1) * INDEX_ENTRY.size:
+        raise IndexError(position)
+
+    offsets = [x[0] for x in INDEX_ENTRY.iter_unpack(entries)]
+    offset = offsets[-1]
+
+    return offset, offsets.count(offset) - 1
+
+
+def iter_docs(fname, start=0):
+    """ Streams the documents from a docs file, one block at a time
+
+    Pass ``start`` to stream the documents from that position on. If the docs
+    file has an index, the reading starts at the block of that document,
+    otherwise the documents before it are decoded and skipped.
+    """
+
+    with open(fname, 'rb') as f:
+        read_block = _read_header(f)
+
+        if start and os.path.exists(docs_index_path(fname)):
+            try:
+                offset, start = _doc_offset(fname, start)
+            except IndexError:
+                return
+
+            f.seek(offset)
+
+        yield from islice(_read_docs(f, read_block), start, None)
+
+
+def read_doc(fname, position):
+    """ Reads the document at given position from an indexed docs file
+
+    Raises IndexError if there's no such document.
+    """
+
+    offset, index = _doc_offset(fname, position)
+
+    with open(fname, 'rb') as f:
+        read_block = _read_header(f)
+        f.seek(offset)
+
+        if read_block is None:
+            return _decode_doc(f.readline())
+
+        docs = read_block(f)
+
+    return docs[index]
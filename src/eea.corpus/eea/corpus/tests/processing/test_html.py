@@ -1,5 +1,7 @@
 from unittest.mock import Mock, patch
 
+import pytest
+
 
 class TestHTML:
     texts = (
@@ -9,7 +11,7 @@ class TestHTML:
 
     def test_schema(self):
         from eea.corpus.processing.html import BeautifulSoupText
-        assert len(BeautifulSoupText().children) == 0
+        assert len(BeautifulSoupText().children) == 1
 
     def test_clean_docs(self):
         from eea.corpus.processing.html import process
@@ -37,7 +39,56 @@ class TestHTML:
         BeautifulSoup.return_value = Mock()
         BeautifulSoup.return_value.get_text.side_effect = ValueError()
 
-        doc = {'text': 'hello world', 'metadata': None}
+        doc = {'text': '<b>hello</b> world', 'metadata': None}
 
         stream = process([doc], {})
         assert list(stream) == []
+
+    @patch('eea.corpus.processing.html.BeautifulSoup')
+    def test_plain_text_is_not_parsed(self, BeautifulSoup):
+        from eea.corpus.processing.html import process
+
+        doc = {'text': 'hello world', 'metadata': None}
+
+        stream = process([doc], {})
+        assert list(stream) == [doc]
+        assert not BeautifulSoup.called
+
+    @pytest.mark.parametrize('backend', ['stream', 'bs4', 'lxml'])
+    def test_backends(self, backend):
+        from eea.corpus.processing.html import BACKENDS, process
+
+        if backend not in BACKENDS:
+            pytest.skip("%s is not installed" % backend)
+
+        texts = self.texts + ("Rivers &amp; lakes",)
+        content = ({'text': s, 'metadata': None} for s in texts)
+        content = process(content, {}, backend=backend)
+
+        assert [doc['text'] for doc in content] == [
+            'Hello world', 'Just plain text', 'Rivers & lakes'
+        ]
+
+    def test_lxml_text(self):
+        pytest.importorskip('lxml')
+
+        from eea.corpus.processing.html import lxml_text, stream_text
+
+        html = """<html><head><style>p {color: red}</style></head>
+        <body><!-- comment --><p>Water &amp; <b>air</b></p>
+        <script>var x = "<p>";</script></body></html>"""
+
+        assert lxml_text(html).split() == ['Water', '&', 'air']
+        assert lxml_text(html).split() == stream_text(html).split()
+
+        assert lxml_text('<!-- comment -->') == ''
+        assert lxml_text('  <!-- comment -->\n') == ''
+
+    def test_stream_text(self):
+        from eea.corpus.processing.html import stream_text
+
+        html = """<html><head><style>p {color: red}</style></head>
+        <body><!-- comment --><p>Water &amp; <b>air</b></p>
+        <script>var x = "<p>";</script></body></html>"""
+
+        assert stream_text(html).split() == ['Water', '&', 'air']
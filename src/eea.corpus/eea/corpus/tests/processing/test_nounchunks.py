@@ -1,3 +1,5 @@
+from unittest.mock import Mock, patch
+
 TEXT = """assessment-2 Use of freshwater resources In general, renewable water
 is abundant in Europe. However, signals from long-term climate and hydrological
 assessments, including on population dynamics, indicate that there was a 24
@@ -42,9 +44,9 @@ class TestNounChunks:
             'drop_determiners': drop,
             'min_freq': min_freq
         }
-        stream = process([doc], {}, **settings)
+        stream = process([[doc]], {}, **settings)
 
-        return next(stream)
+        return next(stream)[0]
 
     def test_tokenize(self):
         res = self.make_one('tokenize')
@@ -81,4 +83,154 @@ class TestNounChunks:
 
     def test_schema(self):
         from eea.corpus.processing.noun_chunks import NounChunks
-        assert len(NounChunks().children) == 3
+        assert len(NounChunks().children) == 4
+
+    @patch('eea.corpus.processing.noun_chunks._nlp_models', {})
+    @patch('eea.corpus.processing.noun_chunks.spacy')
+    def test_get_nlp(self, spacy):
+        from eea.corpus.processing.noun_chunks import get_nlp
+
+        nlp = get_nlp()
+        assert get_nlp() is nlp
+        spacy.load.assert_called_once_with('en', disable=['ner'])
+
+        # missing models are not loaded again
+        spacy.load.side_effect = OSError()
+        assert get_nlp('xx') is None
+        assert get_nlp('xx') is None
+        assert spacy.load.call_count == 2
+
+    @patch('eea.corpus.processing.noun_chunks.get_nlp')
+    @patch('eea.corpus.processing.noun_chunks.detect_language')
+    def test_parse_batch_languages(self, detect_language, get_nlp):
+        from eea.corpus.processing.noun_chunks import parse_batch
+
+        langs = {'water': 'en', 'eau': 'fr', 'Wasser': 'de'}
+        detect_language.side_effect = lambda text: langs[text.split()[0]]
+
+        def nlp(lang):
+            if lang == 'de':
+                return None
+
+            model = Mock()
+            model.pipe.side_effect = lambda texts, batch_size: [
+                (lang, text) for text in texts
+            ]
+
+            return model
+
+        get_nlp.side_effect = nlp
+
+        texts = ['water 1', 'eau 2', 'Wasser 3', 'water 4']
+        assert parse_batch(texts) == [
+            ('en', 'water 1'), ('fr', 'eau 2'), None, ('en', 'water 4')
+        ]
+        assert get_nlp.call_count == 3
+
+        # the default model is used if the language can't be detected
+        detect_language.side_effect = ValueError()
+        get_nlp.reset_mock()
+        assert parse_batch(['water']) == [('en', 'water')]
+        get_nlp.assert_called_once_with('en')
+
+    def test_parse_texts_with_error(self):
+        from eea.corpus.processing.noun_chunks import parse_texts
+
+        nlp = Mock()
+        nlp.pipe.side_effect = ValueError()
+        nlp.side_effect = lambda text: text.upper()
+
+        assert parse_texts(nlp, ['a', 'b']) == ['A', 'B']
+
+        nlp.side_effect = ValueError()
+        assert parse_texts(nlp, ['a', 'b']) == [None, None]
+
+    def test_batches(self):
+        from eea.corpus.processing.noun_chunks import process
+
+        docs = [{'text': 'The renewable water is abundant.', 'metadata': i}
+                for i in range(3)]
+        settings = {
+            'mode': 'tokenize',
+            'drop_determiners': True,
+            'min_freq': 1,
+        }
+        res = list(process([docs[:2], docs[2:]], {}, **settings))
+
+        assert [len(batch) for batch in res] == [2, 1]
+        assert [doc['metadata'] for doc in res[0] + res[1]] == [0, 1, 2]
+        assert 'renewable_water' in res[0][0]['text']
+
+    def test_tokenize_spans(self):
+        from eea.corpus.processing.noun_chunks import tokenize_spans
+
+        def span(start, end):
+            return Mock(start_char=start, end_char=end)
+
+        text = "the water stress and water stress conditions"
+        spans = [span(21, 44), span(4, 16), span(26, 32)]
+
+        assert tokenize_spans(text, spans) == \
+            "the water_stress and water_stress_conditions"
+        assert tokenize_spans(text, []) == text
+
+    @patch('eea.corpus.processing.noun_chunks.upload_location')
+    @patch('eea.corpus.processing.noun_chunks.frequencies_path')
+    def test_corpus_frequency(self, frequencies_path, upload_location,
+                              tmpdir):
+        from eea.corpus.processing.noun_chunks import process
+        import os
+        import time
+
+        upload = tmpdir.mkdir('upload').join('test.csv')
+        upload.write('text')
+        upload_location.return_value = str(upload)
+
+        path = str(tmpdir.join('counts.ncfreq'))
+        frequencies_path.return_value = path
+
+        texts = ["The water stress is high.",
+                 "The water stress is low. The air is clean."]
+        docs = [{'text': text, 'metadata': None} for text in texts]
+        settings = {
+            'mode': 'replace',
+            'drop_determiners': True,
+            'min_freq': 2,
+            'freq_scope': 'corpus',
+        }
+
+        env = {'file_name': 'test.csv', 'preview_mode': False}
+
+        res = list(process([docs], env, **settings))
+        res = [doc['text'] for batch in res for doc in batch]
+        assert res == ['water_stress', 'water_stress']
+
+        # the counts are saved, the temporary chunks file is removed
+        assert tmpdir.join('counts.ncfreq').exists()
+        assert not [p for p in tmpdir.listdir() if p.ext == '.tmp']
+
+        with patch('eea.corpus.processing.noun_chunks.count_chunks') as cc:
+            res = list(process([docs[1:]], env, **settings))
+            assert not cc.called
+
+        assert res[0][0]['text'] == 'water_stress'
+
+        # the document has been uploaded again, the counts are done again
+        later = time.time() + 10
+        os.utime(str(upload), (later, later))
+        env['preview_mode'] = True
+
+        res = list(process([docs[1:]], env, **settings))
+        assert [doc['text'] for doc in res[0]] == ['']
+        assert not tmpdir.join('counts.ncfreq').exists()
+
+        settings['freq_scope'] = 'document'
+        res = list(process([docs], env, **settings))
+        assert [doc['text'] for doc in res[0]] == ['', '']
+
+    def test_is_parallel(self):
+        from eea.corpus.processing.noun_chunks import is_parallel
+
+        assert is_parallel({'freq_scope': 'document'})
+        assert is_parallel({})
+        assert not is_parallel({'freq_scope': 'corpus'})
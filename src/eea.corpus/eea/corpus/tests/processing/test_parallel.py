@@ -0,0 +1,85 @@
+from unittest.mock import patch
+from pyramid import testing
+
+
+class TestParallel:
+    @classmethod
+    def setup_class(cls):
+        cls.config = testing.setUp()
+        cls.config.scan('eea.corpus.processing')
+
+    @classmethod
+    def teardown_class(cls):
+        testing.tearDown()
+
+    def test_process_batch(self):
+        from eea.corpus.processing.html import process
+        from eea.corpus.processing.parallel import process_batch
+
+        docs = [{'text': '<b>Hello</b> %s' % i, 'metadata': {}}
+                for i in range(3)]
+        calls = [(process, {}, {}, None)]
+
+        assert [d['text'] for d in process_batch((calls, docs))] == [
+            'Hello 0', 'Hello 1', 'Hello 2'
+        ]
+
+    def test_parallel_process_keeps_order(self):
+        from eea.corpus.processing.html import process
+        from eea.corpus.processing.parallel import parallel_process
+
+        docs = ({'text': '<b>doc</b> %s' % i, 'metadata': {}}
+                for i in range(100))
+        calls = [(process, {}, {}, None)]
+
+        res = parallel_process(docs, calls, 2, batch_size=7)
+
+        assert [d['text'] for d in res] == ['doc %s' % i for i in range(100)]
+
+    def test_pipeline_stages(self):
+        from eea.corpus.processing import _pipeline_stages
+
+        html = ('eea_corpus_processing_html_process', 'a', {})
+        limit = ('eea_corpus_processing_limit_process', 'b', {})
+        tokenizer = ('eea_corpus_processing_regextokenizer_process', 'c', {})
+
+        steps = [html, tokenizer, limit, tokenizer]
+
+        assert _pipeline_stages(steps, True) == [
+            (True, [html, tokenizer]),
+            (False, [limit]),
+            (True, [tokenizer]),
+        ]
+        assert _pipeline_stages(steps, False) == [
+            (False, [html]),
+            (False, [tokenizer]),
+            (False, [limit]),
+            (False, [tokenizer]),
+        ]
+
+    @patch('eea.corpus.processing.upload_location')
+    def test_build_pipeline_in_processes(self, upload_location):
+        from eea.corpus.processing import build_pipeline
+        from pkg_resources import resource_filename
+
+        upload_location.return_value = resource_filename(
+            'eea.corpus', 'tests/fixtures/test.csv')
+
+        pipeline = [
+            ('eea_corpus_processing_html_process', 'ABC', {}),
+            ('eea_corpus_processing_limit_process', 'DEF', {'max_count': 5}),
+        ]
+
+        with patch('eea.corpus.processing.parallel_process') as pp:
+            pp.side_effect = lambda content, calls, processes: iter([])
+            list(build_pipeline('test.csv', 'text', pipeline,
+                                preview_mode=True, processes=2))
+            assert not pp.called
+
+        serial = list(build_pipeline('test.csv', 'text', pipeline,
+                                     preview_mode=False))
+        parallel = list(build_pipeline('test.csv', 'text', pipeline,
+                                       preview_mode=False, processes=2))
+
+        assert len(parallel) == 5
+        assert [d['text'] for d in parallel] == [d['text'] for d in serial]
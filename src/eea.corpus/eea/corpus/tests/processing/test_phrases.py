@@ -1,4 +1,4 @@
-from unittest.mock import patch, sentinel as S, Mock    # , call,
+from unittest.mock import patch, sentinel as S, Mock, MagicMock  # , call,
 import pytest
 
 
@@ -26,6 +26,7 @@ class TestUtils:
             'abc.phras.1',
             'abc',
             'abc.phras',
+            'abc.phras.2.frozen',
         ]
         res = phrase_model_files('/corpus', phash_id)
 
@@ -35,32 +36,138 @@ class TestUtils:
 class TestAsync:
 
     @patch('eea.corpus.processing.phrases.async.build_phrase_models')
-    @patch('eea.corpus.processing.phrases.async.build_pipeline')
     @patch('eea.corpus.processing.phrases.async.corpus_base_path')
-    def test_build_phrases_job(self, corpus_base_path, build_pipeline,
-                               build_phrase_models):
+    def test_build_phrases_job(self, corpus_base_path, build_phrase_models):
 
+        from eea.corpus.config import PIPELINE_STEP_CACHE
+        from eea.corpus.processing import PipelineContent
         from eea.corpus.processing.phrases.async import build_phrases
+        from eea.corpus.processing.phrases.phrases import TokenizedContent
+        from eea.corpus.processing.spill import SpillStore
+        from eea.corpus.processing.utils import component_phash_id
 
         corpus_base_path.return_value = '/corpus'
-        build_pipeline.return_value = S.content
 
         build_phrases([S.step1, S.step2],
                       'some.csv', 'text', 'phash_abc', S.settings)
 
         corpus_base_path.assert_called_once_with('some.csv')
 
-        assert build_pipeline.call_args[0] == ('some.csv', 'text', [S.step1])
-        assert build_phrase_models.call_args[0] == (
-            S.content, '/corpus/phash_abc.phras', S.settings
+        sentences, path, settings = build_phrase_models.call_args[0]
+        assert isinstance(sentences, SpillStore)
+        assert sentences.path == '/corpus/%s.sents' % component_phash_id(
+            'some.csv', 'text', [S.step1]
         )
+        assert isinstance(sentences.source, TokenizedContent)
+
+        content = sentences.source.content
+        assert isinstance(content, PipelineContent)
+        assert content.use_cache is PIPELINE_STEP_CACHE
+        assert (content.file_name, content.text_column) == \
+            ('some.csv', 'text')
+        assert content.pipeline == [S.step1]
+        assert content.preview_mode is False
+        assert (path, settings) == ('/corpus/phash_abc.phras', S.settings)
+
+    @patch('eea.corpus.processing.phrases.async.upload_location')
+    @patch('eea.corpus.processing.phrases.async.build_phrase_models')
+    @patch('eea.corpus.processing.phrases.async.corpus_base_path')
+    def test_build_phrases_job_sentences_file(self, corpus_base_path,
+                                              build_phrase_models,
+                                              upload_location, tmpdir):
+        from eea.corpus.processing.phrases.async import build_phrases
+        import os
+
+        corpus_base_path.return_value = str(tmpdir)
+
+        upload = tmpdir.join('some.csv')
+        upload.write('text')
+        upload_location.return_value = str(upload)
+
+        def build(sentences, path, settings):
+            # the sentences left from a previous upload are not reused
+            assert not sentences.exists
+
+            with open(sentences.path, 'w') as f:
+                f.write('sentences')
+
+        build_phrase_models.side_effect = build
+
+        stale = tmpdir.join('abc.sents')
+        stale.write('old sentences')
+        os.utime(str(stale), (0, 0))
+
+        with patch('eea.corpus.processing.phrases.async.spill_path') as sp:
+            sp.return_value = str(stale)
+            build_phrases([S.step1, S.step2],
+                          'some.csv', 'text', 'phash_abc', S.settings)
+
+        assert build_phrase_models.called
+        assert not stale.exists()
+
+    @patch('eea.corpus.processing.phrases.phrases.parse_batch')
+    def test_tokenized_content_batches(self, parse_batch):
+        from eea.corpus.processing.phrases.phrases import (NLP_BATCH_SIZE,
+                                                           TokenizedContent)
+
+        def sdoc(text):
+            if text == 'broken':
+                return None
+
+            sents = [[Mock(text=w) for w in s.split()]
+                     for s in text.split('. ')]
+
+            return Mock(sents=sents)
+
+        parse_batch.side_effect = lambda texts: [sdoc(t) for t in texts]
+
+        docs = [{'text': 'hello world. water stress', 'metadata': None},
+                {'text': 'broken', 'metadata': None}] * NLP_BATCH_SIZE
+        textacy_doc = Mock(tokenized_text=[['plain', 'text']])
+
+        sentences = list(TokenizedContent(docs + [textacy_doc]))
+
+        assert sentences[:2] == [['hello', 'world'], ['water', 'stress']]
+        assert len(sentences) == 2 * NLP_BATCH_SIZE + 1
+        assert sentences[-1] == ['plain', 'text']
+
+        # the docs are parsed in batches
+        assert parse_batch.call_count == 3
+        assert len(parse_batch.call_args_list[0][0][0]) == NLP_BATCH_SIZE
 
+    @patch('eea.corpus.processing.phrases.phrases.Phraser')
     @patch('eea.corpus.processing.phrases.phrases.Phrases')
-    def test_build_phrase_models(self, Phrases):
+    def test_build_phrase_models_passes(self, Phrases, Phraser):
         from eea.corpus.processing.phrases.phrases import build_phrase_models
-        from textacy.doc import Doc
 
-        content = [Doc('hello'), Doc('world')]
+        class Content:
+            """ A re-iterable content that counts its iterations
+            """
+
+            passes = 0
+
+            def __iter__(self):
+                self.passes += 1
+
+                return iter([['hello', 'world'], ['hello', 'there']])
+
+        # the Phrases model consumes the sentences stream it gets
+        Phrases.side_effect = lambda sentences: list(sentences) and Mock()
+        Phraser.return_value = MagicMock()
+        Phraser.return_value.__getitem__.side_effect = lambda s: s
+
+        content = Content()
+        build_phrase_models(content, '/tmp/x.phras', {'level': 4})
+
+        # the content is streamed again for each n-gram level
+        assert content.passes == 3
+
+    @patch('eea.corpus.processing.phrases.phrases.Phraser')
+    @patch('eea.corpus.processing.phrases.phrases.Phrases')
+    def test_build_phrase_models(self, Phrases, Phraser):
+        from eea.corpus.processing.phrases.phrases import build_phrase_models
+
+        content = [['hello'], ['world']]
 
         phrases = Phrases()
         Phrases.return_value = phrases
@@ -70,6 +177,9 @@ class TestAsync:
         # call count should be 1, but we called above once
         assert Phrases.call_count == 2
         assert phrases.save.call_args[0] == ('/corpus/some.csv.phras.2',)
+        assert Phraser.return_value.save.call_args[0] == (
+            '/corpus/some.csv.phras.2.frozen',
+        )
 
         build_phrase_models(content, '/corpus/some.csv.phras', {'level': 3})
 
@@ -80,14 +190,18 @@ class TestAsync:
     @pytest.mark.slow
     def test_build_phrase_models_real(self, doc_content_stream):
 
-        from eea.corpus.processing.phrases.phrases import build_phrase_models
+        from eea.corpus.processing.phrases.phrases import (
+            TokenizedContent, build_phrase_models
+        )
         from eea.corpus.utils import rand
         from gensim.models.phrases import Phrases
-        from itertools import tee, chain
+        from itertools import chain, tee
         import os.path
         import tempfile
 
-        content_A, content_B, test_A = tee(doc_content_stream, 3)
+        docs = list(doc_content_stream)
+        content_A = content_B = TokenizedContent(docs)
+        test_A = docs
 
         # proof that the simple_content_stream can be used for phrases
         # ph_model = Phrases(content_A)
@@ -101,7 +215,9 @@ class TestAsync:
 
         assert b_name + '.2' in os.listdir(base_dir)
         assert not (b_name + '.3' in os.listdir(base_dir))
+        assert b_name + '.2.frozen' in os.listdir(base_dir)
         os.remove(base_path + '.2')
+        os.remove(base_path + '.2.frozen')
 
         t_name = rand(10)
         base_path = os.path.join(base_dir, t_name)
@@ -113,11 +229,12 @@ class TestAsync:
         pm2 = Phrases.load(base_path + '.2')
         pm3 = Phrases.load(base_path + '.3')
 
-        os.remove(base_path + '.2')
-        os.remove(base_path + '.3')
+        for path in [base_path + '.2', base_path + '.3']:
+            os.remove(path)
+            os.remove(path + '.frozen')
 
         # an iterator of sentences, each a list of words
-        test_A = chain.from_iterable(doc.tokenized_text for doc in test_A)
+        test_A = iter(TokenizedContent(test_A))
         trigrams = pm3[pm2[test_A]]
         words = chain.from_iterable(trigrams)
         w2, w3 = tee(words, 2)
@@ -529,3 +646,40 @@ class TestViews:
                                             'preview__job_status_here_'}
 
         phrase_model_status.__globals__['CORPUS_STORAGE'] = o_st
+
+
+class TestPhraseModelsCache:
+
+    @patch('eea.corpus.processing.phrases.phrases.Phraser')
+    @patch('eea.corpus.processing.phrases.phrases.Phrases')
+    def test_load_phrase_model(self, Phrases, Phraser, tmpdir):
+        from eea.corpus.processing.phrases.phrases import (
+            load_phrase_model, phrase_models_cache
+        )
+        import os
+
+        phrase_models_cache.clear()
+        Phraser.side_effect = lambda phrases: Mock()
+
+        path = tmpdir.join('abc.phras.2')
+        path.write('')
+        fpath = str(path)
+
+        model = load_phrase_model(fpath)
+        assert load_phrase_model(fpath) is model
+        assert Phrases.load.call_count == 1
+        Phrases.load.assert_called_with(fpath)
+        assert Phraser.load.call_count == 0
+
+        # the file has changed, the model is loaded again
+        st = os.stat(fpath)
+        os.utime(fpath, (st.st_atime, st.st_mtime + 10))
+        assert load_phrase_model(fpath) is not model
+        assert Phrases.load.call_count == 2
+
+        # the frozen export is preferred
+        tmpdir.join('abc.phras.2.frozen').write('')
+        os.utime(fpath, (st.st_atime, st.st_mtime + 20))
+        assert load_phrase_model(fpath) is Phraser.load.return_value
+        Phraser.load.assert_called_with(fpath + '.frozen')
+        assert Phrases.load.call_count == 2
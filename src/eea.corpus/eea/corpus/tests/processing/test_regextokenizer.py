@@ -1,3 +1,5 @@
+import pytest
+
 TEXT = """def process(content, env, **settings):
     \"\"\" Tokenization
     \"\"\"
@@ -17,7 +19,45 @@ TEXT = """def process(content, env, **settings):
 class TestRegexTokenizer:
     def test_schema(self):
         from eea.corpus.processing.regextokenizer import RegexTokenizer
-        assert len(RegexTokenizer().children) == 1
+        assert len(RegexTokenizer().children) == 2
+
+    def test_schema_validation(self):
+        from eea.corpus.processing.regextokenizer import RegexTokenizer
+        import colander
+
+        schema = RegexTokenizer()
+        res = schema.deserialize({'regex': r'\w+', 'engine': 're'})
+        assert res == {'regex': r'\w+', 'engine': 're'}
+
+        with pytest.raises(colander.Invalid) as e:
+            schema.deserialize({'regex': r'[\w+', 'engine': 're'})
+
+        assert 'regex' in e.value.asdict()
+
+        with pytest.raises(colander.Invalid):
+            schema.deserialize({'regex': r'\w+', 'engine': 'perl'})
+
+    def test_compile_pattern(self):
+        from eea.corpus.processing.regextokenizer import compile_pattern
+        from eea.corpus.processing.regextokenizer import tokenizer
+
+        pattern = compile_pattern(r'\w+')
+        assert compile_pattern(r'\w+') is pattern
+        assert compile_pattern(r'\w+', 're') is pattern
+
+        assert tokenizer('Hello, world', r'\w*') == ['Hello', 'world']
+
+    @pytest.mark.parametrize('engine', ['re', 'regex', 're2'])
+    def test_engines(self, engine):
+        from eea.corpus.processing.regextokenizer import ENGINES, process
+
+        if engine not in ENGINES:
+            pytest.skip("%s is not installed" % engine)
+
+        doc = {'text': 'Hello, world', 'metadata': None}
+        res = next(process([doc], {}, regex=r'\w+|,', engine=engine))
+
+        assert res['text'] == 'Hello , world'
 
     def test_from_doc(self):
         from eea.corpus.processing.regextokenizer import process
@@ -0,0 +1,65 @@
+import pytest
+
+
+class TestSpillStore:
+
+    sentences = [['hello', 'world'], ['second', 'sentence']] * 150
+
+    def test_spill_path(self):
+        from eea.corpus.processing.spill import spill_path
+
+        assert spill_path('/corpus/var/a.csv', 'abc', 'sents') == \
+            '/corpus/var/a.csv/abc.sents'
+
+    def test_spill_and_replay(self, tmpdir):
+        from eea.corpus.processing.spill import SpillStore
+
+        class Source:
+            passes = 0
+
+            def __iter__(s):
+                s.passes += 1
+                return iter(self.sentences)
+
+        source = Source()
+        path = str(tmpdir.join('abc.sents'))
+        store = SpillStore(path, source)
+
+        assert store.exists is False
+        assert list(store) == self.sentences
+        assert store.exists is True
+
+        # the next passes are replayed from disk
+        assert list(store) == self.sentences
+        assert list(store) == self.sentences
+        assert source.passes == 1
+
+        # another store, with the same path, uses the same spill file
+        assert list(SpillStore(path, None)) == self.sentences
+
+    def test_partial_consumption(self, tmpdir):
+        from eea.corpus.processing.spill import SpillStore
+
+        store = SpillStore(str(tmpdir.join('abc.sents')), self.sentences)
+
+        stream = iter(store)
+        next(stream)
+        stream.close()
+
+        # a partially consumed stream is not saved
+        assert store.exists is False
+        assert tmpdir.listdir() == []
+
+    def test_source_error(self, tmpdir):
+        from eea.corpus.processing.spill import SpillStore
+
+        def source():
+            yield ['hello']
+            raise ValueError
+
+        store = SpillStore(str(tmpdir.join('abc.sents')), source())
+
+        with pytest.raises(ValueError):
+            list(store)
+
+        assert tmpdir.listdir() == []
@@ -1,3 +1,8 @@
+from unittest.mock import patch
+
+import pytest
+
+
 class TestStopWords:
     text = """In general, renewable water is abundant in Europe. However,
     signals from long-term climate and hydrological assessments, including on
@@ -12,7 +17,7 @@ class TestStopWords:
 
     def test_schema(self):
         from eea.corpus.processing.stopwords import StopWords
-        assert len(StopWords().children) == 0
+        assert len(StopWords().children) == 3
 
     def test_remove_stopwords(self):
         from eea.corpus.processing.stopwords import process
@@ -24,3 +29,108 @@ class TestStopWords:
 
         assert 'general' in text['text']
         assert 'from' not in text['text']
+
+    def test_remove_custom_stopwords(self):
+        from eea.corpus.processing.stopwords import process
+
+        doc = {'text': self.text, 'metadata': None}
+        content = process([doc], {}, languages={'english', 'german'},
+                          custom_stopwords='renewable,\nwater  Europe')
+        text = next(content)['text']
+
+        assert 'general' in text
+        assert 'from' not in text
+        assert 'renewable' not in text
+        assert 'water' not in text
+        assert 'Europe' not in text
+
+    @patch('eea.corpus.processing.stopwords._language_stopwords', {})
+    @patch('eea.corpus.processing.stopwords.stopwords')
+    def test_language_stopwords(self, stopwords):
+        from eea.corpus.processing.stopwords import language_stopwords
+
+        stopwords.words.return_value = ['a', 'the']
+        stops = language_stopwords('english')
+
+        assert stops == frozenset(['a', 'the'])
+        assert language_stopwords('english') is stops
+        assert stopwords.words.call_count == 1
+
+        stopwords.words.side_effect = OSError()
+        assert language_stopwords('klingon') == frozenset()
+
+    def test_parse_stopwords(self):
+        from eea.corpus.processing.stopwords import parse_stopwords
+
+        assert parse_stopwords(' a, b\nc  d,,') == frozenset('abcd')
+        assert parse_stopwords('') == frozenset()
+        assert parse_stopwords(None) == frozenset()
+
+    @pytest.mark.slow
+    def test_benchmark_stopwords(self):
+        """ Compare the stopwords filtering with a list and a frozenset
+
+        Run with ``pytest --runslow -s -k benchmark_stopwords`` to see the
+        results.
+        """
+        from eea.corpus.processing.stopwords import get_stopwords
+        from nltk.tokenize import word_tokenize
+        import time
+
+        words = word_tokenize(self.text) * 1000
+        stops = get_stopwords()
+        stops_list = sorted(stops)
+
+        res = {}
+
+        for name, container in [('list', stops_list), ('frozenset', stops)]:
+            start = time.time()
+            filtered = [w for w in words if w not in container]
+            res[name] = len(words) / (time.time() - start)
+
+        assert filtered == [w for w in words if w not in stops_list]
+
+        print("\nStopwords filtering, tokens/sec: %s" % ', '.join(
+            '%s: %d' % (k, v) for k, v in res.items()))
+
+        assert res['frozenset'] > res['list']
+
+    @pytest.mark.parametrize('tokenizer', ['regex', 'simple', 'nltk'])
+    def test_tokenizers(self, tokenizer):
+        from eea.corpus.processing.stopwords import process
+
+        doc = {'text': self.text, 'metadata': None}
+        text = next(process([doc], {}, tokenizer=tokenizer))['text']
+
+        assert 'general' in text
+        assert 'from' not in text
+        assert 'renewable water' in text
+
+    def test_regex_tokenize(self):
+        from eea.corpus.processing.stopwords import regex_tokenize
+
+        assert regex_tokenize("In general, it's a 24% decrease.") == [
+            'In', 'general', ',', 'it', "'", 's', 'a', '24', '%', 'decrease',
+            '.'
+        ]
+
+    @pytest.mark.slow
+    def test_benchmark_tokenizers(self):
+        """ Compare the throughput of the stopwords component tokenizers
+
+        Run with ``pytest --runslow -s -k benchmark_tokenizers`` to see the
+        results.
+        """
+        from eea.corpus.processing.stopwords import TOKENIZERS
+        import time
+
+        texts = [self.text] * 500
+        res = {}
+
+        for name, (title, tokenize) in TOKENIZERS.items():
+            start = time.time()
+            count = sum(len(tokenize(text)) for text in texts)
+            res[name] = count / (time.time() - start)
+            print("\n%-8s %d tokens/sec" % (name, res[name]))
+
+        assert res['regex'] > res['nltk']
@@ -0,0 +1,84 @@
+from unittest.mock import patch
+
+
+class TestCatalogue:
+    """ Tests for the corpus catalogue
+    """
+
+    @patch('eea.corpus.catalogue.catalogue_path')
+    def test_register_corpus(self, catalogue_path, tmpdir):
+        from eea.corpus.catalogue import (CorpusInfo, catalogue_corpuses,
+                                          catalogue_exists, register_corpus,
+                                          unregister_corpus)
+
+        catalogue_path.return_value = str(tmpdir.join('var', 'catalogue.db'))
+        assert catalogue_exists() is False
+
+        register_corpus('a.csv', 'corpus1', 'First', '', 10)
+        register_corpus('a.csv', 'corpus2', 'Second', 'Some text', 20)
+        register_corpus('b.csv', 'corpus3', 'Third', None, 30)
+
+        assert catalogue_exists() is True
+
+        res = catalogue_corpuses()
+        assert res == {
+            'a.csv': [
+                CorpusInfo('a.csv', 'corpus1', 'First', '', 10),
+                CorpusInfo('a.csv', 'corpus2', 'Second', 'Some text', 20),
+            ],
+            'b.csv': [
+                CorpusInfo('b.csv', 'corpus3', 'Third', '', 30),
+            ]
+        }
+
+        # registering again replaces the corpus info
+        register_corpus('a.csv', 'corpus1', 'First', '', 15)
+        assert catalogue_corpuses()['a.csv'][0].n_docs == 15
+
+        unregister_corpus('a.csv', 'corpus1')
+        assert [c.corpus_id for c in catalogue_corpuses()['a.csv']] == [
+            'corpus2'
+        ]
+
+    @patch('eea.corpus.catalogue.catalogue_path')
+    def test_populated(self, catalogue_path, tmpdir):
+        from eea.corpus.catalogue import (is_populated, mark_populated,
+                                          register_corpus)
+
+        catalogue_path.return_value = str(tmpdir.join('var', 'catalogue.db'))
+        assert is_populated() is False
+
+        # registering a built corpus doesn't fill the catalogue
+        register_corpus('a.csv', 'corpus1', 'First', '', 10)
+        assert is_populated() is False
+
+        mark_populated()
+        assert is_populated() is True
+
+    @patch('eea.corpus.corpus.register_corpus')
+    @patch('eea.corpus.corpus.mark_populated')
+    @patch('eea.corpus.corpus.load_corpus_metadata')
+    @patch('eea.corpus.corpus.available_corpus')
+    @patch('eea.corpus.corpus.os.listdir')
+    def test_rebuild_catalogue(self, listdir, available_corpus,
+                               load_corpus_metadata, mark_populated,
+                               register_corpus):
+        from eea.corpus.corpus import rebuild_catalogue
+
+        listdir.return_value = ['a.csv', 'b.txt']
+        available_corpus.return_value = ['good', 'broken']
+
+        def load(file_name, corpus_id):
+            if corpus_id == 'broken':
+                raise ValueError("truncated file")
+
+            return {'title': 'Good', 'description': 'desc',
+                    'statistics': {'docs': 3}}
+
+        load_corpus_metadata.side_effect = load
+
+        rebuild_catalogue()
+
+        register_corpus.assert_called_once_with('a.csv', 'good', 'Good',
+                                                'desc', 3)
+        assert mark_populated.called
@@ -7,20 +7,92 @@ class TestCorpus:
 
     @patch('eea.corpus.corpus.load_corpus_metadata')
     @patch('eea.corpus.corpus.corpus_base_path')
-    def test_corpus_caching(self, corpus_base_path, load_corpus_metadata):
+    def test_corpus_iteration(self, corpus_base_path, load_corpus_metadata,
+                              tmpdir):
         from eea.corpus.corpus import Corpus
+        from eea.corpus.storage import write_docs
 
-        corpus = Corpus('filename', 'corpusid')
-        corpus._docs_stream = iter(range(100))
+        corpus_base_path.return_value = str(tmpdir)
+        docs = [{'text': 'doc %s' % i, 'metadata': {}} for i in range(100)]
+        write_docs(docs, str(tmpdir.join('corpusid_docs.json')))
 
-        assert len(corpus._cache) == 0
+        corpus = Corpus('filename', 'corpusid')
 
+        # the docs file is streamed again on each iteration
         x = list(corpus)
         assert len(x) == 100
+        assert list(corpus) == docs
         assert len(list(corpus)) == 100
-        assert len(list(corpus)) == 100
-        assert corpus._use_cache is True
-        assert len(corpus._cache) == 100
+        assert len(corpus._cache) == 0
+
+    @patch('eea.corpus.corpus.read_doc')
+    @patch('eea.corpus.corpus.load_corpus_metadata')
+    @patch('eea.corpus.corpus.corpus_base_path')
+    def test_corpus_caching(self, corpus_base_path, load_corpus_metadata,
+                            read_doc, tmpdir):
+        from eea.corpus.corpus import Corpus
+        import pytest
+
+        corpus_base_path.return_value = str(tmpdir)
+        load_corpus_metadata.return_value = {'statistics': {'docs': 100}}
+        tmpdir.join('corpusid_docs.idx').write('')
+        read_doc.side_effect = lambda path, i: {'text': 'x' * i}
+
+        corpus = Corpus('filename', 'corpusid', cache_size=3)
+        for i in range(5):
+            corpus.get_doc(i)
+        assert corpus._cache.keys() == [2, 3, 4]
+
+        corpus.get_doc(2)
+        assert read_doc.call_count == 5
+        corpus.get_doc(5)
+        assert corpus._cache.keys() == [4, 2, 5]
+
+        corpus = Corpus('filename', 'corpusid', cache_policy='bytes',
+                        cache_size=200)
+        corpus.get_doc(90)
+        corpus.get_doc(80)
+        assert corpus._cache.keys() == [80]
+
+        read_doc.reset_mock()
+        corpus = Corpus('filename', 'corpusid', cache_policy='none')
+        corpus.get_doc(1)
+        corpus.get_doc(1)
+        assert corpus._cache is None
+        assert read_doc.call_count == 2
+
+        with pytest.raises(ValueError):
+            Corpus('filename', 'corpusid', cache_policy='all')
+
+    @patch('eea.corpus.corpus.read_doc')
+    @patch('eea.corpus.corpus.load_corpus_metadata')
+    @patch('eea.corpus.corpus.corpus_base_path')
+    def test_corpus_shared_cache(self, corpus_base_path, load_corpus_metadata,
+                                 read_doc, tmpdir):
+        from eea.corpus.corpus import (Corpus, invalidate_corpus,
+                                       shared_docs_cache)
+
+        corpus_base_path.return_value = str(tmpdir)
+        load_corpus_metadata.return_value = {'statistics': {'docs': 100}}
+        tmpdir.join('corpusid_docs.idx').write('')
+        read_doc.side_effect = lambda path, i: {'text': 'x' * i}
+
+        shared_docs_cache.clear()
+
+        first = Corpus('filename', 'first', cache_policy='shared')
+        second = Corpus('filename', 'second', cache_policy='shared')
+        first.get_doc(1)
+        second.get_doc(1)
+        first.get_doc(1)
+
+        assert first._cache is second._cache is shared_docs_cache
+        assert shared_docs_cache.keys() == [
+            ('filename', 'second', 1), ('filename', 'first', 1)
+        ]
+        assert read_doc.call_count == 2
+
+        invalidate_corpus('filename', 'first')
+        assert shared_docs_cache.keys() == [('filename', 'second', 1)]
 
     @patch('eea.corpus.corpus.load_corpus_metadata')
     @patch('eea.corpus.corpus.corpus_base_path')
@@ -37,9 +109,11 @@ class TestCorpus:
         assert corpus.title == 'corpus title'
         assert corpus.description == 'corpus description'
 
+    @patch('eea.corpus.corpus.register_corpus')
     @patch('eea.corpus.corpus.corpus_base_path')
     @patch('eea.corpus.corpus.build_pipeline')
-    def test_build_corpus(self, build_pipeline, corpus_base_path, tmpdir):
+    def test_build_corpus(self, build_pipeline, corpus_base_path,
+                          register_corpus, tmpdir):
         from eea.corpus.corpus import build_corpus
         import json
 
@@ -68,6 +142,7 @@ class TestCorpus:
 
         assert path.join('test_info.json').exists()
         assert path.join('test_docs.json').exists()
+        assert path.join('test_docs.idx').size() == 16
 
         docs = []
         with path.join('test_docs.json').open() as f:
@@ -92,19 +167,156 @@ class TestCorpus:
                 'text_column': 'text'
             }
 
+        register_corpus.assert_called_with(
+            'test.csv', 'test', 'first corpus', 'something else', 2
+        )
+
+    @patch('eea.corpus.corpus.register_corpus')
+    @patch('eea.corpus.corpus.corpus_base_path')
+    @patch('eea.corpus.corpus.build_pipeline')
+    def test_build_corpus_with_stopwords(self, build_pipeline,
+                                         corpus_base_path, register_corpus,
+                                         tmpdir):
+        from eea.corpus.corpus import build_corpus
+        from eea.corpus.processing.stopwords import StopWords
+        import json
+
+        path = tmpdir.join('.', 'test.csv')
+        path.mkdir()
+        corpus_base_path.return_value = str(path)
+        build_pipeline.return_value = [{'text': 'Hello', 'metadata': {}}]
+
+        settings = StopWords().deserialize({
+            'languages': ['german', 'french', 'english'],
+            'custom_stopwords': 'hello',
+            'tokenizer': 'regex',
+        })
+        # a list, serializable and with a stable order for the corpus id
+        assert settings['languages'] == ['english', 'french', 'german']
+
+        kw = {'title': 'first corpus', 'description': '', 'ABC': settings}
+
+        build_corpus([], 'test', 'test.csv', 'text', **kw)
+
+        with path.join('test_info.json').open() as f:
+            meta = json.load(f)
+
+        assert meta['kw']['ABC']['languages'] == [
+            'english', 'french', 'german'
+        ]
+
+    @patch('eea.corpus.corpus.register_corpus')
+    @patch('eea.corpus.corpus.corpus_base_path')
+    @patch('eea.corpus.corpus.build_pipeline')
+    def test_build_corpus_processes(self, build_pipeline, corpus_base_path,
+                                    register_corpus, tmpdir):
+        from eea.corpus.corpus import build_corpus
+        from pyramid import testing
+
+        corpus_base_path.return_value = str(tmpdir)
+        build_pipeline.return_value = []
+        kw = {'title': 'first corpus'}
+
+        testing.setUp()
+        build_corpus([], 'test', 'test.csv', 'text', **kw)
+        assert build_pipeline.call_args[1]['processes'] == 1
+
+        testing.setUp(settings={'corpus.pipeline_processes': '4'})
+        build_corpus([], 'test', 'test.csv', 'text', **kw)
+        assert build_pipeline.call_args[1]['processes'] == 4
+
+        testing.tearDown()
+
+    @patch('eea.corpus.corpus.load_corpus_metadata')
+    @patch('eea.corpus.corpus.corpus_base_path')
+    def test_corpus_get_doc(self, corpus_base_path, load_corpus_metadata,
+                            tmpdir):
+        from eea.corpus.corpus import Corpus
+        from eea.corpus.storage import write_docs
+        import pytest
+
+        corpus_base_path.return_value = str(tmpdir)
+        load_corpus_metadata.return_value = {'statistics': {'docs': 50}}
+
+        docs = [{'text': 'doc %s' % i, 'metadata': {'i': i}}
+                for i in range(50)]
+        write_docs(docs, str(tmpdir.join('corpusid_docs.json')))
+
+        corpus = Corpus('filename', 'corpusid')
+
+        assert corpus.get_doc(0) == docs[0]
+        assert corpus.get_doc(42) == docs[42]
+        assert corpus[17] == docs[17]
+        assert corpus[-1] == docs[49]
+
+        # slices are streamed, they don't fill the cache
+        corpus._cache.clear()
+
+        with patch('eea.corpus.corpus.read_doc') as read_doc:
+            assert corpus[10:13] == docs[10:13]
+            assert corpus[:] == docs
+            assert corpus[45:] == docs[45:]
+            assert corpus[5:20:4] == docs[5:20:4]
+            assert corpus[::-7] == docs[::-7]
+            assert corpus[20:10] == []
+            assert not read_doc.called
+
+        assert len(corpus._cache) == 0
+
+        with pytest.raises(IndexError):
+            corpus.get_doc(50)
+
+        # corpuses without an index are streamed
+        tmpdir.join('corpusid_docs.idx').remove()
+        assert corpus.get_doc(42) == docs[42]
+
+    @patch('eea.corpus.corpus.corpus_docs_path')
     @patch('eea.corpus.corpus.Corpus')
     @patch('eea.corpus.corpus.extract_corpus_id')
-    def test_get_corpus(self, extract_corpus_id, Corpus):
-        from eea.corpus.corpus import get_corpus
+    def test_get_corpus(self, extract_corpus_id, Corpus, corpus_docs_path,
+                        tmpdir):
+        from eea.corpus.corpus import corpus_registry, get_corpus
+        import os
+
+        corpus_registry.clear()
+
+        path = tmpdir.join('docs.json')
+        path.write('')
+        corpus_docs_path.return_value = str(path)
 
         extract_corpus_id.return_value = ('doc-a', 'corpus-b')
-        Corpus.return_value = object()
+        Corpus.side_effect = lambda **kw: object()
 
         request = Mock()
         corpus = get_corpus(request)
-        assert corpus is Corpus.return_value
-        Corpus.assert_called_with(file_name='doc-a', corpus_id='corpus-b')
+        Corpus.assert_called_with(file_name='doc-a', corpus_id='corpus-b',
+                                  cache_policy='shared')
+
+        # the corpus is taken from the registry
+        assert get_corpus(request) is corpus
+        assert Corpus.call_count == 1
+
+        other = get_corpus(request, 'doc-b', 'corpus-c')
+        assert other is not corpus
+        Corpus.assert_called_with(file_name='doc-b', corpus_id='corpus-c',
+                                  cache_policy='shared')
+
+        # the docs file has changed, the corpus is loaded again
+        st = os.stat(str(path))
+        os.utime(str(path), (st.st_atime, st.st_mtime + 10))
+        assert get_corpus(request) is not corpus
+        assert Corpus.call_count == 3
+        assert len(corpus_registry) == 2
+
+        extract_corpus_id.return_value = (None, None)
+        assert get_corpus(request) is None
+
+    def test_invalidate_corpus(self):
+        from eea.corpus.corpus import corpus_registry, invalidate_corpus
+
+        corpus_registry.clear()
+        corpus_registry[('doc-a', 'corpus-b', 1)] = object()
+        corpus_registry[('doc-a', 'corpus-c', 1)] = object()
 
-        corpus = get_corpus(request, 'doc-b', 'corpus-c')
-        assert corpus is Corpus.return_value
-        Corpus.assert_called_with(file_name='doc-b', corpus_id='corpus-c')
+        invalidate_corpus('doc-a', 'corpus-b')
+        assert corpus_registry.keys() == [('doc-a', 'corpus-c', 1)]
@@ -31,3 +31,191 @@ class TestProcessing:
 
         docs = list(stream)
         assert len(docs) == 2
+
+    @patch('eea.corpus.processing.document_stream')
+    @patch('eea.corpus.processing.upload_location')
+    def test_build_pipeline_reads_preview_rows(self, upload_location,
+                                               document_stream):
+        from eea.corpus.processing import build_pipeline, PREVIEW_OVERREAD
+
+        upload_location.return_value = '/corpus/test.csv'
+        document_stream.return_value = iter([])
+
+        build_pipeline('test.csv', 'text', [], preview_mode=True,
+                       preview_size=5)
+        assert document_stream.call_args[1] == {
+            'metadata_columns': None,
+            'chunksize': 5,
+            'nrows': 5 * PREVIEW_OVERREAD,
+        }
+
+        build_pipeline('test.csv', 'text', [], preview_mode=False,
+                       preview_size=5)
+        assert document_stream.call_args[1] == {'metadata_columns': None}
+
+    def test_build_pipeline_preview_size(self):
+        from eea.corpus.processing import build_pipeline
+        from pkg_resources import resource_filename
+
+        fpath = resource_filename('eea.corpus', 'tests/fixtures/test.csv')
+
+        with patch('eea.corpus.processing.upload_location') as ul:
+            ul.return_value = fpath
+            stream = build_pipeline('test.csv', 'text', [],
+                                    preview_mode=True, preview_size=2)
+            docs = list(stream)
+
+        # nothing is filtered, so we get all the over-read rows
+        assert len(docs) == 20
+
+    @patch('eea.corpus.processing.prune_step_cache')
+    @patch('eea.corpus.processing.step_cache_path')
+    @patch('eea.corpus.processing.upload_location')
+    def test_build_pipeline_step_cache(self, upload_location,
+                                       step_cache_path, prune_step_cache,
+                                       tmpdir):
+        from eea.corpus.processing import build_pipeline
+        from pkg_resources import resource_filename
+
+        upload_location.return_value = resource_filename(
+            'eea.corpus', 'tests/fixtures/test.csv')
+        step_cache_path.side_effect = lambda file_name, phash_id: str(
+            tmpdir.join('%s.step' % phash_id))
+
+        pipeline = [
+            ('eea_corpus_processing_limit_process', 'ABC', {'max_count': 3}),
+        ]
+
+        # previewing doesn't save the steps output
+        docs = list(build_pipeline('test.csv', 'text', pipeline,
+                                   preview_mode=True, use_cache=True))
+        assert len(docs) == 3
+        assert tmpdir.listdir() == []
+
+        docs = list(build_pipeline('test.csv', 'text', pipeline,
+                                   preview_mode=False, use_cache=True))
+        assert len(docs) == 3
+        assert len(tmpdir.listdir()) == 1
+
+        # the saved output is used, the document is not read again
+        with patch('eea.corpus.processing.document_stream') as ds:
+            cached = list(build_pipeline('test.csv', 'text', pipeline,
+                                         preview_mode=True, use_cache=True))
+            assert not ds.called
+
+        assert [d['text'] for d in cached] == [d['text'] for d in docs]
+        assert prune_step_cache.call_count == 1
+
+    def test_is_fresh(self, tmpdir):
+        from eea.corpus.processing import is_fresh
+        import os
+
+        document = tmpdir.join('test.csv')
+        document.write('text')
+        step = tmpdir.join('abc.step')
+
+        assert is_fresh(str(step), str(document)) is False
+
+        step.write('docs')
+        assert is_fresh(str(step), str(document)) is True
+
+        # the document has been uploaded again
+        os.utime(str(step), (0, 0))
+        assert is_fresh(str(step), str(document)) is False
+        assert not step.exists()
+
+    def test_prune_step_cache(self, tmpdir):
+        from eea.corpus.processing import prune_step_cache
+        import os
+        import time
+
+        base = tmpdir.mkdir('var').mkdir('test.csv')
+        now = time.time()
+
+        for name, age in [('new', 0), ('recent', 10), ('older', 20),
+                          ('old', 3600)]:
+            path = base.join('%s.step' % name)
+            path.write('x' * 100)
+            os.utime(str(path), (now - age, now - age))
+
+        base.join('model.phras').write('x' * 1000)
+
+        with patch('eea.corpus.processing.CORPUS_STORAGE', str(tmpdir)):
+            prune_step_cache(max_age=1800, max_size=250)
+
+        assert sorted(p.basename for p in base.listdir()) == [
+            'model.phras', 'new.step', 'recent.step'
+        ]
+
+    @patch('eea.corpus.corpus.corpus_base_path')
+    def test_clear_step_cache(self, corpus_base_path, tmpdir):
+        from eea.corpus.processing import clear_step_cache
+
+        corpus_base_path.return_value = str(tmpdir)
+        tmpdir.join('abc.step').write('docs')
+        tmpdir.join('abc.sents').write('docs')
+
+        clear_step_cache('test.csv')
+
+        assert [p.basename for p in tmpdir.listdir()] == ['abc.sents']
+
+    def test_run_process_in_batches(self):
+        from eea.corpus.processing.utils import run_process
+
+        seen = []
+
+        def process(batches, env, **settings):
+            for docs in batches:
+                seen.append(len(docs))
+                yield [doc * settings['times'] for doc in docs]
+
+        res = run_process(process, iter(range(7)), {}, {'times': 2},
+                          batch_size=3)
+
+        assert list(res) == [0, 2, 4, 6, 8, 10, 12]
+        assert seen == [3, 3, 1]
+
+        res = run_process(lambda content, env: (x + 1 for x in content),
+                          range(3), {}, {})
+        assert list(res) == [1, 2, 3]
+
+    @patch('eea.corpus.processing.upload_location')
+    def test_build_pipeline_with_batch_component(self, upload_location):
+        from eea.corpus.processing import build_pipeline, pipeline_registry
+        from eea.corpus.processing import Processor
+        from pkg_resources import resource_filename
+
+        upload_location.return_value = resource_filename(
+            'eea.corpus', 'tests/fixtures/test.csv')
+
+        def process(batches, env, **settings):
+            for docs in batches:
+                assert isinstance(docs, list)
+                yield [{'text': doc['text'].upper(), 'metadata': {}}
+                       for doc in docs]
+
+        pipeline_registry['batch_upper'] = Processor(
+            'batch_upper', None, process, 'Upper', [], False, 2
+        )
+        pipeline = [
+            ('batch_upper', 'ABC', {}),
+            ('eea_corpus_processing_limit_process', 'DEF', {'max_count': 5}),
+        ]
+
+        try:
+            docs = list(build_pipeline('test.csv', 'text', pipeline,
+                                       preview_mode=True))
+        finally:
+            del pipeline_registry['batch_upper']
+
+        assert len(docs) == 5
+        assert all(doc['text'].isupper() for doc in docs)
+
+    def test_component_phash_id_with_sets(self):
+        from eea.corpus.processing.utils import component_phash_id
+
+        step = ('comp', 'ABC', {'languages': {'english', 'german', 'french'}})
+        other = ('comp', 'DEF', {'languages': {'french', 'german', 'english'}})
+
+        assert component_phash_id('a.csv', 'text', [step]) == \
+            component_phash_id('a.csv', 'text', [other])
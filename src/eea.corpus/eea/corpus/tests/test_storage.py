@@ -0,0 +1,103 @@
+import pytest
+
+
+class TestStorage:
+    """ Tests for the corpus docs files
+    """
+
+    docs = [
+        {'text': 'Document number %s\nwith some ünicode' % i,
+         'metadata': {'i': i}}
+        for i in range(250)
+    ]
+
+    @pytest.mark.parametrize('doc_format', ['json', 'msgpack'])
+    @pytest.mark.parametrize('codec', ['none', 'gzip', 'zstd', 'lz4'])
+    def test_write_read_docs(self, codec, doc_format, tmpdir):
+        from eea.corpus.storage import (CODECS, FORMATS, iter_docs, read_doc,
+                                        write_docs)
+
+        if codec not in CODECS:
+            pytest.skip("Codec %s is not available" % codec)
+
+        if doc_format not in FORMATS:
+            pytest.skip("Format %s is not available" % doc_format)
+
+        fname = str(tmpdir.join('corpus_docs.json'))
+        write_docs(self.docs, fname, codec=codec, doc_format=doc_format)
+
+        assert tmpdir.join('corpus_docs.idx').size() == 250 * 8
+
+        assert list(iter_docs(fname)) == self.docs
+        assert read_doc(fname, 0) == self.docs[0]
+        assert read_doc(fname, 99) == self.docs[99]
+        assert read_doc(fname, 100) == self.docs[100]
+        assert read_doc(fname, 249) == self.docs[249]
+
+        with pytest.raises(IndexError):
+            read_doc(fname, 250)
+
+        assert list(iter_docs(fname, start=1)) == self.docs[1:]
+        assert list(iter_docs(fname, start=150)) == self.docs[150:]
+        assert list(iter_docs(fname, start=250)) == []
+
+        # without an index, the documents before start are skipped
+        tmpdir.join('corpus_docs.idx').remove()
+        assert list(iter_docs(fname, start=150)) == self.docs[150:]
+
+    def test_compressed_is_smaller(self, tmpdir):
+        from eea.corpus.storage import write_docs
+
+        plain = tmpdir.join('plain_docs.json')
+        compressed = tmpdir.join('gzip_docs.json')
+        write_docs(self.docs, str(plain))
+        write_docs(self.docs, str(compressed), codec='gzip')
+
+        assert compressed.size() < plain.size()
+        assert compressed.read_binary().startswith(b'EEACORPUS ')
+
+    def test_unknown_codec(self, tmpdir):
+        from eea.corpus.storage import write_docs
+
+        with pytest.raises(ValueError):
+            write_docs(self.docs, str(tmpdir.join('x_docs.json')),
+                       codec='rar')
+
+        with pytest.raises(ValueError):
+            write_docs(self.docs, str(tmpdir.join('x_docs.json')),
+                       doc_format='xml')
+
+    @pytest.mark.slow
+    def test_benchmark_formats(self, tmpdir):
+        """ Compare the write and read times of the docs formats
+
+        Run with ``pytest --runslow -s -k benchmark_formats`` to see the
+        results.
+        """
+        from eea.corpus.storage import FORMATS, iter_docs, write_docs
+        from pkg_resources import resource_filename
+        import pandas as pd
+        import time
+
+        fpath = resource_filename('eea.corpus', 'tests/fixtures/test.csv')
+        df = pd.read_csv(fpath)
+        meta = df[df.columns.difference(['text'])]
+        docs = [
+            {'text': text, 'metadata': dict(zip(meta.keys(), row))}
+            for text, row in zip(df['text'], meta.values)
+        ] * 20
+
+        for doc_format in FORMATS:
+            fname = str(tmpdir.join('%s_docs.json' % doc_format))
+
+            start = time.time()
+            write_docs(docs, fname, doc_format=doc_format)
+            written = time.time()
+            count = sum(1 for doc in iter_docs(fname))
+            read = time.time()
+
+            assert count == len(docs)
+            print("%-8s write: %.3fs read: %.3fs size: %s bytes" % (
+                doc_format, written - start, read - written,
+                tmpdir.join('%s_docs.json' % doc_format).size()
+            ))
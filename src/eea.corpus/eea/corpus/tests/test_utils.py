@@ -58,3 +58,227 @@ class TestConvertorDecorators:
         assert res is not doc
         assert res['text'] == 'second time with more words'
         assert res['metadata'] == {'1': 2}
+
+
+class TestDocumentStream:
+    """ Tests for streaming docs from an uploaded CSV file
+    """
+
+    def test_document_stream(self):
+        from eea.corpus.utils import document_stream
+        from pkg_resources import resource_filename
+        from types import GeneratorType
+
+        fpath = resource_filename('eea.corpus', 'tests/fixtures/test.csv')
+
+        stream = document_stream(fpath, 'text', chunksize=10)
+        assert isinstance(stream, GeneratorType)
+
+        doc = next(stream)
+        assert doc['text'].startswith('assessment-2')
+        assert doc['metadata']['label'] == 'Use of freshwater resources'
+        assert 'text' not in doc['metadata']
+        assert len(doc['metadata']) == 15
+
+        assert len(list(stream)) == 118
+
+    def test_document_stream_metadata_columns(self):
+        from eea.corpus.utils import document_stream
+        from pkg_resources import resource_filename
+
+        fpath = resource_filename('eea.corpus', 'tests/fixtures/test.csv')
+
+        stream = document_stream(fpath, 'text', metadata_columns=['label'])
+        doc = next(stream)
+        assert doc['metadata'] == {'label': 'Use of freshwater resources'}
+
+    def test_document_stream_from_sidecar(self, tmpdir):
+        pytest.importorskip('pyarrow')
+
+        from eea.corpus.utils import (convert_to_sidecar, document_columns,
+                                      document_stream, has_sidecar)
+        from pkg_resources import resource_filename
+        import shutil
+
+        fpath = str(tmpdir.join('test.csv'))
+        shutil.copy(
+            resource_filename('eea.corpus', 'tests/fixtures/test.csv'), fpath
+        )
+        assert has_sidecar(fpath) is False
+
+        csv_docs = list(document_stream(fpath, 'text'))
+
+        assert convert_to_sidecar(fpath, row_group_size=50) == \
+            fpath + '.parquet'
+        assert has_sidecar(fpath) is True
+
+        docs = list(document_stream(fpath, 'text', chunksize=7))
+        assert len(docs) == len(csv_docs) == 119
+        assert [d['text'] for d in docs] == [d['text'] for d in csv_docs]
+        assert docs[0]['metadata']['label'] == 'Use of freshwater resources'
+        assert isinstance(docs[0]['metadata']['expires'], float)
+
+        docs = list(document_stream(fpath, 'text', nrows=10, chunksize=3,
+                                    metadata_columns=['label']))
+        assert len(docs) == 10
+        assert docs[0]['metadata'] == {'label': 'Use of freshwater resources'}
+
+        assert document_columns(fpath)[:2] == ['text', 'label']
+
+    def test_convert_to_sidecar_chunks(self, tmpdir):
+        pytest.importorskip('pyarrow')
+
+        from eea.corpus.utils import (convert_to_sidecar, document_stream,
+                                      has_sidecar)
+
+        fpath = tmpdir.join('test.csv')
+        rows = ['text,count'] + ['doc %s,%s' % (i, i) for i in range(10)]
+        fpath.write('\n'.join(rows + ['doc 10,', 'doc 11,11']))
+        fpath = str(fpath)
+
+        # missing values in later chunks fit the types of the first chunk
+        assert convert_to_sidecar(fpath, row_group_size=4) == \
+            fpath + '.parquet'
+
+        docs = list(document_stream(fpath, 'text'))
+        assert len(docs) == 12
+        assert docs[11]['metadata'] == {'count': 11}
+
+        # the column types change, the CSV file is used
+        tmpdir.join('test.csv.parquet').remove()
+        tmpdir.join('test.csv').write('\n'.join(rows + ['doc 10,many']))
+
+        assert convert_to_sidecar(fpath, row_group_size=4) is None
+        assert has_sidecar(fpath) is False
+        assert [p.basename for p in tmpdir.listdir()] == ['test.csv']
+
+
+class TestDocumentColumns:
+    """ Tests for the column discovery of uploaded files
+    """
+
+    @patch('eea.corpus.utils.has_sidecar')
+    def test_document_columns(self, has_sidecar, tmpdir):
+        from eea.corpus.utils import document_columns
+        import os
+
+        has_sidecar.return_value = False
+        path = tmpdir.join('test.csv')
+        path.write('text,label\n"hello world",a\n')
+
+        assert document_columns(str(path)) == ['text', 'label']
+
+        with patch('eea.corpus.utils.read_csv') as read_csv:
+            # it's cached, the file is not read again
+            assert document_columns(str(path)) == ['text', 'label']
+            assert read_csv.call_count == 0
+
+        path.write('text,label,other\n"hello world",a,b\n')
+        st = os.stat(str(path))
+        os.utime(str(path), (st.st_atime, st.st_mtime + 10))
+
+        assert document_columns(str(path)) == ['text', 'label', 'other']
+
+
+class TestFrequencyCounter:
+
+    def test_count_min_sketch(self):
+        from eea.corpus.utils import CountMinSketch
+
+        sketch = CountMinSketch(width=64, depth=3)
+        words = ['word%s' % i for i in range(100)]
+
+        for i, word in enumerate(words):
+            sketch.add(word, i)
+
+        # never underestimated
+        assert all(sketch[word] >= i for i, word in enumerate(words))
+        assert sketch['missing'] >= 0
+
+        sketch = CountMinSketch()
+        sketch.add('water')
+        sketch.add('water', 2)
+        assert sketch['water'] == 3
+        assert sketch['air'] == 0
+
+    def test_frequency_counter(self):
+        from eea.corpus.utils import FrequencyCounter
+
+        counter = FrequencyCounter(max_items=3)
+
+        for word in ['water', 'air', 'water']:
+            counter.add(word)
+
+        assert counter.sketch is None
+        assert (counter['water'], counter['air'], counter['soil']) == (2, 1, 0)
+
+        for word in ['soil', 'noise', 'water']:
+            counter.add(word)
+
+        assert counter.counts is None
+        assert counter['water'] == 3
+        assert counter['noise'] == 1
+
+
+def reference_tokenizer(text):
+    """ The original, generators based, implementation of utils.tokenizer
+    """
+
+    def handle_slash(words):
+        for word in words:
+            for bit in word.split('/'):
+                yield bit
+
+    def handle_numbers(words):
+        for word in words:
+            if word.isnumeric():
+                yield "*number*"
+            yield word
+
+    def lower_words(words):
+        yield from (w.lower() for w in words)
+
+    def filter_small_words(words):
+        for w in words:
+            if len(w) > 2:
+                yield w
+
+    ignore_chars = "()*:\"><][#\n\t'^%?=&"
+
+    for c in ignore_chars:
+        text = text.replace(c, ' ')
+    words = text.split(' ')
+
+    return list(filter_small_words(lower_words(handle_numbers(
+        handle_slash(words)))))
+
+
+class TestTokenizer:
+
+    def test_tokenizer(self):
+        from eea.corpus.utils import tokenizer
+
+        text = "In 2014, 86 million (Inhabitants) lived/worked in: A/B areas"
+
+        assert tokenizer(text) == [
+            '2014,', '*number*', 'million', 'inhabitants', 'lived',
+            'worked', 'areas'
+        ]
+
+    def test_same_as_reference(self):
+        from eea.corpus.utils import tokenizer
+        import random
+
+        rnd = random.Random(42)
+        alphabet = ("abcXYZ019 /\t\n\r\x0b.,;-'\"()*:><][#^%?=&_"
+                    "½Ⅻ٣İΣßé ")
+
+        for i in range(5000):
+            text = ''.join(rnd.choice(alphabet)
+                           for _ in range(rnd.randint(0, 40)))
+            assert tokenizer(text) == reference_tokenizer(text), text
+
+        with open(__file__) as f:
+            text = f.read()
+
+        assert tokenizer(text) == reference_tokenizer(text)
@@ -5,9 +5,18 @@ import logging
 import os
 import random
 import string
+import threading
+from collections import Counter, OrderedDict
 
-from cytoolz import compose
+import numpy
 from eea.corpus.config import CORPUS_STORAGE
+from pandas import read_csv
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:     # pragma: no cover
+    pyarrow = None
 
 logger = logging.getLogger('eea.corpus')
 
@@ -51,6 +60,194 @@ def hashed_id(items):
     return m.hexdigest()
 
 
+# number of CSV rows parsed at once when streaming an uploaded document
+CSV_CHUNKSIZE = 1000
+
+
+def _chunk_docs(chunk, text_column):
+    """ Converts a parsed chunk (a DataFrame) to a stream of docs
+    """
+
+    texts = chunk[text_column]
+    meta = chunk[chunk.columns.difference([text_column])]
+    keys = list(meta.keys())
+
+    for text, row in zip(texts, meta.values):
+        # strip rows where there's no text
+
+        if text and isinstance(text, str):
+            yield {'text': text, 'metadata': dict(zip(keys, row))}
+
+
+def sidecar_location(document_path):
+    """ Returns the path of the columnar (Parquet) copy of an uploaded file
+    """
+
+    return document_path + '.parquet'
+
+
+def has_sidecar(document_path):
+    """ Check if an up to date Parquet copy exists for an uploaded file
+    """
+
+    if pyarrow is None:
+        return False
+
+    path = sidecar_location(document_path)
+
+    if not os.path.exists(path):
+        return False
+
+    return os.path.getmtime(path) >= os.path.getmtime(document_path)
+
+
+def convert_to_sidecar(document_path, row_group_size=CSV_CHUNKSIZE):
+    """ Writes a Parquet copy of the uploaded CSV file, next to it
+
+    The CSV file is parsed only once, after the upload. After that, the
+    document is read from the Parquet file, using column projection and
+    memory mapping. Returns the path of the Parquet file, or None if pyarrow
+    is not installed or the file can't be converted.
+
+    The CSV file is parsed and written in chunks of ``row_group_size`` rows.
+    The column types are fixed by the first chunk, if a later chunk has
+    values of another type (ex: text in a numeric column) the conversion is
+    abandoned, and the CSV file is used.
+    """
+
+    if pyarrow is None:
+        logger.warning("pyarrow is not installed, can't convert %s",
+                       document_path)
+
+        return None
+
+    path = sidecar_location(document_path)
+    tmp_path = '%s.%s.tmp' % (path, rand(8))
+    writer = None
+
+    try:
+        for chunk in read_csv(document_path, chunksize=row_group_size):
+            if writer is None:
+                schema = pyarrow.Schema.from_pandas(chunk,
+                                                    preserve_index=False)
+                writer = pq.ParquetWriter(tmp_path, schema)
+
+            table = pyarrow.Table.from_pandas(chunk, schema=schema,
+                                              preserve_index=False)
+            writer.write_table(table)
+
+        if writer is None:
+            return None
+
+        writer.close()
+        os.rename(tmp_path, path)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        logger.warning("Column types change in %s, it's not converted",
+                       document_path)
+
+        return None
+    finally:
+        if writer is not None:
+            writer.close()
+
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    logger.info("Wrote columnar copy of %s at %s", document_path, path)
+
+    return path
+
+
+def _csv_chunks(document_path, columns, chunksize, nrows):
+    return read_csv(document_path, chunksize=chunksize, usecols=columns,
+                    nrows=nrows)
+
+
+def _sidecar_chunks(document_path, columns, chunksize, nrows):
+    count = 0
+
+    with pyarrow.memory_map(sidecar_location(document_path), 'r') as source:
+        pf = pq.ParquetFile(source)
+
+        for i in range(pf.num_row_groups):
+            table = pf.read_row_group(i, columns=columns)
+
+            for offset in range(0, table.num_rows, chunksize):
+                size = chunksize
+
+                if nrows is not None:
+                    if count >= nrows:
+                        return
+                    size = min(size, nrows - count)
+
+                chunk = table.slice(offset, size).to_pandas()
+                count += len(chunk)
+
+                # pyarrow converts missing values to None, CSV parsing gives
+                # NaN
+                yield chunk.where(chunk.notnull(), float('nan'))
+
+
+def document_stream(document_path, text_column, metadata_columns=None,
+                    chunksize=CSV_CHUNKSIZE, nrows=None):
+    """ Lazily streams {'text', 'metadata'} docs from an uploaded CSV file
+
+    The file is parsed in chunks of ``chunksize`` rows, so memory usage stays
+    flat, no matter the size of the file. If ``metadata_columns`` is given,
+    only those columns (plus the text column) are parsed, otherwise all the
+    other columns are used as metadata. If ``nrows`` is given, parsing stops
+    after that many rows.
+
+    If a Parquet copy of the file exists (see ``convert_to_sidecar``), the
+    docs are read from it instead of parsing the CSV file.
+    """
+
+    columns = None
+
+    if metadata_columns is not None:
+        columns = [text_column] + [c for c in metadata_columns
+                                   if c != text_column]
+
+    if has_sidecar(document_path):
+        chunks = _sidecar_chunks(document_path, columns, chunksize, nrows)
+    else:
+        chunks = _csv_chunks(document_path, columns, chunksize, nrows)
+
+    for chunk in chunks:
+        yield from _chunk_docs(chunk, text_column)
+
+
+# cache of document_path: ((mtime, size), column names)
+_columns_cache = {}
+
+
+def document_columns(document_path):
+    """ Returns the list of column names of an uploaded CSV file
+
+    Only the header of the file is read. The result is cached, keyed by the
+    file modification time and size, so changed files are read again.
+    """
+
+    st = os.stat(document_path)
+    key = (st.st_mtime, st.st_size)
+
+    cached = _columns_cache.get(document_path)
+
+    if cached is not None and cached[0] == key:
+        return list(cached[1])
+
+    if has_sidecar(document_path):
+        columns = pq.read_schema(sidecar_location(document_path)).names
+    else:
+        # parse just the first row, to get the same column names that
+        # read_csv would produce for the whole file
+        columns = list(read_csv(document_path, nrows=1).keys())
+
+    _columns_cache[document_path] = (key, tuple(columns))
+
+    return list(columns)
+
+
 def set_text(doc, text):
     """ Build a new doc based on doc's metadata and provided text
     """
@@ -66,6 +263,143 @@ def is_locked(fpath):
     return os.path.exists(path)
 
 
+class LRUCache(object):
+    """ A bounded mapping that evicts the least recently used items
+
+    The cache is bounded by ``maxsize``, compared against the sum of the items
+    sizes, as computed by ``getsizeof(value)``. By default each item has size
+    1, so ``maxsize`` is the maximum number of items. Items bigger then
+    ``maxsize`` are not cached.
+
+    It is safe to share an LRUCache between threads.
+    """
+
+    def __init__(self, maxsize, getsizeof=None):
+        self.maxsize = maxsize
+        self.getsizeof = getsizeof or (lambda value: 1)
+        self.currsize = 0
+
+        self._data = OrderedDict()      # key: (value, size)
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+
+            return self._data[key][0]
+
+    def __setitem__(self, key, value):
+        size = self.getsizeof(value)
+
+        with self._lock:
+            self.pop(key)
+
+            if size > self.maxsize:
+                return
+
+            self._data[key] = (value, size)
+            self.currsize += size
+
+            while self.currsize > self.maxsize:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.currsize -= evicted
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value, size = self._data.pop(key)
+            self.currsize -= size
+
+            return value
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.currsize = 0
+
+
+class CountMinSketch(object):
+    """ Approximate counts of strings, using a fixed amount of memory
+
+    The counts are never underestimated. With the default size (4 x 2**20
+    counters, 16MB), the error stays small for tens of millions of distinct
+    items. The hashing is stable, so a sketch can be saved and loaded in
+    another process.
+    """
+
+    def __init__(self, width=2**20, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = numpy.zeros((depth, width), dtype=numpy.uint32)
+        self._rows = numpy.arange(depth)
+
+    def _columns(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'),
+                                 digest_size=4 * self.depth).digest()
+
+        return numpy.frombuffer(digest, dtype='<u4') % self.width
+
+    def add(self, key, count=1):
+        self.table[self._rows, self._columns(key)] += count
+
+    def __getitem__(self, key):
+        return int(self.table[self._rows, self._columns(key)].min())
+
+
+# number of distinct items counted exactly by a FrequencyCounter
+EXACT_COUNT_LIMIT = 1000000
+
+
+class FrequencyCounter(object):
+    """ Counts the frequency of strings
+
+    The counts are exact until there are more than ``max_items`` distinct
+    items. After that, the counts are moved to a ``CountMinSketch``, to keep
+    the memory usage bounded.
+    """
+
+    def __init__(self, max_items=EXACT_COUNT_LIMIT):
+        self.max_items = max_items
+        self.counts = Counter()
+        self.sketch = None
+
+    def add(self, key):
+        if self.sketch is not None:
+            self.sketch.add(key)
+
+            return
+
+        self.counts[key] += 1
+
+        if len(self.counts) > self.max_items:
+            logger.info("Frequency counter: switching to a count-min sketch")
+            self.sketch = CountMinSketch()
+
+            for k, count in self.counts.items():
+                self.sketch.add(k, count)
+
+            self.counts = None
+
+    def __getitem__(self, key):
+        if self.sketch is not None:
+            return self.sketch[key]
+
+        return self.counts[key]
+
+
 def schema_defaults(schema):
     """ Returns a mapping of fielname:defaultvalue
     """
@@ -96,42 +430,26 @@ def tokenize(phrase, delimiter='_'):
     return delimiter.join(res)
 
 
-def handle_slash(words):
-    for word in words:
-        for bit in word.split('/'):
-            yield bit
-
-
-def handle_numbers(words):
-    for word in words:
-        if word.isnumeric():
-            yield "*number*"
-        yield word
-
-
-def lower_words(words):
-    yield from (w.lower() for w in words)
+# characters that separate the words, for the simple tokenizer
+TOKENIZER_SEPARATORS = "()*:\"><][#\n\t'^%?=& /"
 
-
-def filter_small_words(words):
-    for w in words:
-        if len(w) > 2:
-            yield w
-
-
-handle_text = compose(filter_small_words, lower_words, handle_numbers,
-                      handle_slash, )
+_tokenizer_table = str.maketrans(dict.fromkeys(TOKENIZER_SEPARATORS, ' '))
 
 
 def tokenizer(text):
     """ Tokenizes text. Returns lists of tokens (words)
+
+    The words are lowercased and the words shorter than 3 characters are
+    dropped. Numbers are preceded by a "*number*" token.
     """
-    ignore_chars = "()*:\"><][#\n\t'^%?=&"
 
-    for c in ignore_chars:
-        text = text.replace(c, ' ')
-    words = text.split(' ')
+    res = []
 
-    text = list(handle_text(words))
+    for word in text.translate(_tokenizer_table).lower().split(' '):
+        if word.isnumeric():
+            res.append("*number*")
+
+        if len(word) > 2:
+            res.append(word)
 
-    return text
+    return res
@@ -15,17 +15,20 @@ from pyramid.httpexceptions import HTTPFound
 from pyramid.renderers import render
 from pyramid.view import view_config
 from pyramid_deform import FormView
+from redis.exceptions import ConnectionError
 
 from eea.corpus.async import queue
-from eea.corpus.config import upload_location
+from eea.corpus.config import PIPELINE_STEP_CACHE, upload_location
 from eea.corpus.corpus import (available_documents, build_corpus,
                                delete_corpus, extract_corpus_id, get_corpus)
-from eea.corpus.processing import build_pipeline, pipeline_registry
+from eea.corpus.processing import (build_pipeline, clear_step_cache,
+                                   pipeline_registry)
 from eea.corpus.schema import (CreateCorpusSchema, TopicExtractionSchema,
                                UploadSchema)
 from eea.corpus.topics import (pyldavis_visualization, termite_visualization,
                                wordcloud_visualization)
-from eea.corpus.utils import document_name, hashed_id, rand, schema_defaults
+from eea.corpus.utils import (convert_to_sidecar, document_name, hashed_id,
+                              rand, schema_defaults)
 
 logger = logging.getLogger('eea.corpus')
 
@@ -65,6 +68,15 @@ class UploadView(FormView):
                 for line in upload['fp']:
                     f.write(line)
 
+            # the steps saved for a previous upload are not valid anymore
+            clear_step_cache(fname)
+
+            # the CSV file is converted by a worker, it can be used meanwhile
+            try:
+                queue.enqueue(convert_to_sidecar, path, timeout='1h')
+            except ConnectionError:
+                logger.warning("Could not enqueue the conversion of %s", path)
+
         self.request.session.flash(u"Your changes have been saved.")
 
         return HTTPFound(location='/')
@@ -345,7 +357,9 @@ class CreateCorpusView(FormView):
                 'file_name': self.document,
                 'text_column': appstruct['column'],
                 'pipeline': pipeline,
-                'preview_mode': True
+                'preview_mode': True,
+                'preview_size': self.preview_size,
+                'use_cache': PIPELINE_STEP_CACHE,
             }
             content_stream = build_pipeline(**pstruct)
 
@@ -409,7 +423,7 @@ def view_corpus(request):
 
     return {
         'corpus': corpus,
-        'doc': next(islice(corpus, page, None)),
+        'doc': corpus[page],
         'nextp': nextp,
         'prevp': prevp,
         'page': page
@@ -37,6 +37,30 @@ corpus_require = [
     'fasttext',
 ]
 
+# optional, columnar copies of the uploaded files
+columnar_require = [
+    'pyarrow',
+]
+
+# optional, faster HTML to text conversion
+html_require = [
+    'lxml',
+]
+
+# optional, extra regular expression engines for the regex tokenizer
+regex_require = [
+    'regex',
+    'google-re2',
+]
+
+# optional, extra compression codecs and binary format for the corpus docs
+# files
+compression_require = [
+    'zstandard',
+    'lz4',
+    'msgpack',
+]
+
 
 setup(
     name='eea.corpus',
@@ -58,6 +82,10 @@ setup(
     zip_safe=False,
     extras_require={
         'testing': tests_require,
+        'columnar': columnar_require,
+        'compression': compression_require,
+        'html': html_require,
+        'regex': regex_require,
     },
     install_requires=requires+corpus_require,
     entry_points={